@@ -0,0 +1,133 @@
+import argparse
+import random
+import re
+import time
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from jobstreet_dates import DateNormalizer, MONTHS
+
+# The regex/strptime versions DateNormalizer replaced, kept as the reference it must agree with
+def reference_email_date(email_date):
+    email_date_str = email_date.split(" (")[0]
+    email_date_obj = datetime.strptime(email_date_str, "%a, %d %b %Y %H:%M:%S %z")
+    return email_date_obj.strftime("%Y-%m-%d")
+
+def reference_application_date(new_date):
+    cleaned_date = unicodedata.normalize("NFKC", new_date)
+    cleaned_date = re.sub(r'\s+', ' ', cleaned_date).strip()
+    cleaned_date = re.sub(r'(\d)\s+(\d)', r'\1\2', cleaned_date)
+    cleaned_date = re.sub(r'(\w)\s+(\w)', r'\1\2', cleaned_date)
+
+    has_year = re.search(r'\d{4}', cleaned_date)
+
+    if has_year:
+        formatted_date = datetime.strptime(cleaned_date, "%d %b %Y").strftime("%Y-%m-%d")
+    else:
+        match = re.search(r"^(.*?)\s*(?:Applicationinformation|Similarjobsyoumight)", cleaned_date, re.IGNORECASE)
+        if match:
+            cleaned_date = match.group(1).strip()
+        cleaned_date = re.sub(r"(\d{1,2})\s*([A-Za-z]{1})\s*([A-Za-z]{2})", r"\1 \2\3", cleaned_date)
+        cleaned_date = re.sub(r"\b([A-Za-z])\s+([A-Za-z])\b", r"\1\2", cleaned_date)
+        cleaned_date = re.sub(r"(\d{1,2})([A-Za-z]{3})", r"\1 \2", cleaned_date)
+
+        one_month_ago = datetime.today().replace(day=1) - timedelta(days=1)
+        assumed_year = one_month_ago.year
+
+        full_date = f"{cleaned_date} {assumed_year}"
+        formatted_date = datetime.strptime(full_date, "%d %b %Y").strftime("%Y-%m-%d")
+
+    return formatted_date
+
+def scatter_spaces(rng, text):
+    # Wrapped plain-text bodies break "12 Mar" in odd places: "1 2 M ar"
+    return "".join(char + (" " * rng.randint(1, 2) if rng.random() < 0.3 else "") for char in text).strip()
+
+def random_application_date(rng):
+    day = rng.choice([rng.randint(1, 31), rng.randint(0, 99), rng.randint(100, 2100)])
+    month = rng.choice(list(MONTHS) + ["March", "Sept", "Foo", "M"])
+    month = rng.choice([month, month.title(), month.upper()])
+    trailer = rng.choice(["", " ", " Similar jobs you might like", " Application information ", " Similar jobs", " Apply now", "  Similar jobs you might like Data Analyst "])
+    text = rng.choice([f"{day} {month}{trailer}", scatter_spaces(rng, f"{day} {month}") + trailer, f"{day}{month}{trailer}"])
+    if rng.random() < 0.05:
+        # Non-breaking spaces and full-width digits, which NFKC folds back
+        text = text.replace(" ", "\u00a0").replace("1", "\uff11")
+    return text
+
+def random_email_date(rng):
+    sent = datetime(2026, 1, 1, tzinfo=timezone(timedelta(hours=rng.choice([-5, 0, 8])))) + timedelta(seconds=rng.randint(0, 400 * 86400))
+    text = format_datetime(sent)
+    variant = rng.random()
+    if variant < 0.2:
+        text += " (UTC)"
+    elif variant < 0.3:
+        text = text.replace(" ", "  ", 1)
+    elif variant < 0.4:
+        text = text.replace(text[:3], text[:3].upper(), 1)
+    elif variant < 0.45:
+        text = text[5:]
+    elif variant < 0.5:
+        text = text[:-5] + rng.choice(["GMT", "+00:00", "Z", "+2500", "-0030"])
+    elif variant < 0.55:
+        text = text.replace(":", "-", 1)
+    return text
+
+def outcome(function, value):
+    try:
+        return function(value)
+    except ValueError:
+        return ValueError
+
+def check(cases, seed):
+    # Property: for any input, the normalizer returns what the reference returns, or both raise ValueError
+    rng = random.Random(seed)
+    dates = DateNormalizer()
+    failures = 0
+    for _ in range(cases):
+        for generate, function, reference in (
+            (random_application_date, dates.application_date, reference_application_date),
+            (random_email_date, dates.email_date, reference_email_date),
+        ):
+            value = generate(rng)
+            expected, actual = outcome(reference, value), outcome(function, value)
+            if expected != actual:
+                failures += 1
+                if failures <= 10:
+                    print(f"MISMATCH {value!r}: reference {expected!r}, normalizer {actual!r}")
+    print(f"{cases * 2} random inputs checked, {failures} mismatches")
+    return failures == 0
+
+def bench(repeat, seed):
+    # A realistic run: a few hundred distinct application dates, and email dates that share their day
+    rng = random.Random(seed)
+    application_dates = [f"{rng.randint(1, 28)} {rng.choice(list(MONTHS)).title()}" for _ in range(300)]
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    email_dates = [format_datetime(start + timedelta(seconds=rng.randint(0, 90 * 86400))) for _ in range(300)]
+    print(f"{'function':<18} {'reference us':>13} {'normalizer us':>14} {'speedup':>8}")
+    for name, values, reference, function in (
+        ("application date", application_dates, reference_application_date, DateNormalizer().application_date),
+        ("email date", email_dates, reference_email_date, DateNormalizer().email_date),
+    ):
+        timings = []
+        for parse in (reference, function):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                for value in values:
+                    outcome(parse, value)
+            timings.append((time.perf_counter() - started) / (repeat * len(values)) * 1e6)
+        print(f"{name:<18} {timings[0]:>13.2f} {timings[1]:>14.2f} {timings[0] / timings[1]:>7.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Check DateNormalizer against the regex/strptime date parsing it replaced, then time both")
+    parser.add_argument("--cases", type=int, default=20000, help="random inputs per date function")
+    parser.add_argument("--repeat", type=int, default=50, help="passes over the timing corpus")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    ok = check(args.cases, args.seed)
+    bench(args.repeat, args.seed)
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import email
+import glob
+import os
+import time
+from email.header import decode_header
+from jobstreet_extractor import EXTRACTORS, subject_kind
+
+def load_corpus(corpus_dir):
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "**", "*.eml"), recursive=True)):
+        with open(path, "rb") as f:
+            raw_email = f.read()
+
+        subject = "".join(
+            part.decode(encoding or "utf-8", errors="replace") if isinstance(part, bytes) else part
+            for part, encoding in decode_header(email.message_from_bytes(raw_email)["Subject"] or "")
+        )
+        kind = subject_kind(subject)
+        if kind:
+            corpus.append((kind, raw_email))
+        else:
+            print(f"Skipping {path}: not a JobStreet notification")
+    return corpus
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the JobStreet extractors over a folder of .eml files")
+    parser.add_argument("corpus", nargs="?", default="samples", help="folder searched recursively for .eml files")
+    parser.add_argument("--repeat", type=int, default=500, help="times each message is extracted")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print(f"No JobStreet .eml files found in '{args.corpus}'")
+        return
+
+    print(f"{'template':<10} {'messages':>9} {'total ms':>10} {'us/msg':>9} {'msg/s':>10}")
+    for kind, extract in EXTRACTORS.items():
+        messages = [raw_email for message_kind, raw_email in corpus if message_kind == kind]
+        if not messages:
+            continue
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            for uid, raw_email in enumerate(messages, 1):
+                extract(uid, raw_email)
+        elapsed = time.perf_counter() - started
+
+        count = len(messages) * args.repeat
+        print(f"{kind:<10} {count:>9} {elapsed * 1000:>10.1f} {elapsed / count * 1e6:>9.1f} {count / elapsed:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import functools
+import imaplib
+import random
+import threading
+import time
+from bench_sync import synthetic_mailbox
+from fake_imap_server import FakeIMAPServer
+from jobstreet_sync import connect_mailbox, fetch_emails, fetch_emails_concurrent
+
+def delayed_session(connect, latency, rng, completed=None, fail_after=None, held_uid=None):
+    # A session whose UID commands take up to `latency` seconds longer, and ten times that
+    # for the chunk starting at held_uid, so chunks finish out of order. It drops the
+    # connection after fail_after commands.
+    imap_server = connect()
+    uid = imap_server.uid
+    calls = 0
+
+    def delayed(command, *args):
+        nonlocal calls
+        calls += 1
+        if fail_after is not None and calls > fail_after:
+            raise imaplib.IMAP4.abort("connection dropped by the check")
+        first_uid = min(int(part.split(":")[0]) for part in args[0].split(","))
+        time.sleep(rng.random() * latency + (10 * latency if first_uid == held_uid else 0))
+        response = uid(command, *args)
+        if completed is not None:
+            completed.append(first_uid)
+        return response
+
+    imap_server.uid = delayed
+    return imap_server
+
+def failing_logins(connect, failures):
+    # The first session logs in, the next `failures` ones are refused
+    calls = 0
+    lock = threading.Lock()
+
+    def login():
+        nonlocal calls
+        with lock:
+            calls += 1
+            refused = 1 < calls <= 1 + failures
+        if refused:
+            raise imaplib.IMAP4.error("LOGIN refused by the check")
+        return connect()
+    return login
+
+def consume(messages, timeout=60):
+    # The fetched messages, or the exception the generator raised; a hang is a failure too
+    outcome = {}
+
+    def run():
+        try:
+            outcome["messages"] = list(messages)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        return TimeoutError(f"no result after {timeout}s")
+    return outcome.get("error", outcome.get("messages"))
+
+def check(connect, uids, chunk_size, seed):
+    # Property: with several sessions and chunks finishing in any order, the concurrent backend
+    # yields exactly what one session fetching the chunks in turn yields, in UID order; and a
+    # failing session surfaces as an exception instead of a short or hanging result
+    rng = random.Random(seed)
+    failures = 0
+
+    def report(name, ok, detail=""):
+        nonlocal failures
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}{': ' + detail if detail and not ok else ''}")
+
+    for fetch_mode in ("text", "full"):
+        imap_server = connect()
+        expected = list(fetch_emails(imap_server, uids, chunk_size, fetch_mode))
+        imap_server.logout()
+        for connections in (2, 4):
+            completed = []
+            session = functools.partial(delayed_session, connect, 0.02, rng, completed, held_uid=min(uids))
+            actual = consume(fetch_emails_concurrent(session, uids, connections, chunk_size, fetch_mode))
+            report(
+                f"{fetch_mode}, {connections} connections, {-(-len(uids) // chunk_size)} chunks",
+                actual == expected,
+                repr(actual) if isinstance(actual, BaseException) else f"{len(actual)} of {len(expected)} messages or out of order",
+            )
+            # The check only means something if chunks really did come back out of order
+            report(f"{fetch_mode}, {connections} connections, chunks finished out of order", completed != sorted(completed))
+
+    # While the first chunk is held up the consumer cannot take anything, so the workers may
+    # only get 2 * connections chunks ahead of it
+    for connections in (2, 4):
+        completed = []
+        session = functools.partial(delayed_session, connect, 0.05, rng, completed, held_uid=min(uids))
+        consume(fetch_emails_concurrent(session, uids, connections, chunk_size))
+        ahead = len(set(completed[:completed.index(min(uids))]))
+        report(f"{connections} connections, {ahead} chunks fetched ahead of a held one", ahead < 2 * connections)
+
+    outcome = consume(fetch_emails_concurrent(failing_logins(connect, 1), uids, 3, chunk_size))
+    report("a refused worker login is raised", isinstance(outcome, imaplib.IMAP4.error), repr(outcome)[:200])
+
+    session = functools.partial(delayed_session, connect, 0.0, rng, fail_after=2)
+    outcome = consume(fetch_emails_concurrent(session, uids, 2, chunk_size))
+    report("a dropped connection mid-fetch is raised", isinstance(outcome, imaplib.IMAP4.abort), repr(outcome)[:200])
+
+    print(f"{failures} failures")
+    return failures == 0
+
+def bench(connect, uids, chunk_size, latency, seed):
+    # One session against several, with a simulated round trip per UID command
+    rng = random.Random(seed)
+    print(f"\n{'connections':>11} {'seconds':>9} {'msg/s':>8}")
+    for connections in (1, 2, 4, 8):
+        session = functools.partial(delayed_session, connect, 2 * latency, rng)
+        started = time.perf_counter()
+        if connections == 1:
+            imap_server = session()
+            count = sum(1 for _ in fetch_emails(imap_server, uids, chunk_size))
+            imap_server.logout()
+        else:
+            count = sum(1 for _ in fetch_emails_concurrent(session, uids, connections, chunk_size))
+        elapsed = time.perf_counter() - started
+        print(f"{connections:>11} {elapsed:>9.2f} {count / elapsed:>8.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the concurrent fetch backend against one session on a local fake IMAP server, then time both")
+    parser.add_argument("--messages", type=int, default=600)
+    parser.add_argument("--chunk-size", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.02, help="mean extra seconds per UID command in the timing run")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    mailbox = synthetic_mailbox(args.messages, args.seed)[0]
+    server = FakeIMAPServer(mailbox)
+    host, port = server.start()
+    connect = functools.partial(connect_mailbox, "check", "check", host, port, False, "INBOX")
+    try:
+        ok = check(connect, list(mailbox.uids), args.chunk_size, args.seed)
+        bench(connect, list(mailbox.uids), args.chunk_size, args.latency, args.seed)
+    finally:
+        server.shutdown()
+        server.server_close()
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
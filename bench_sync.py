@@ -0,0 +1,182 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import quopri
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import openpyxl
+import jobstreet_applications
+from fake_imap_server import FakeMailbox, FakeIMAPServer
+from jobstreet_metrics import metrics
+
+COMPANIES = ["Acme Pte Ltd", "Globex Corporation", "Initech Sdn. Bhd.", "Umbrella Holdings", "Stark Industries"]
+POSITIONS = ["Software Engineer", "Data Analyst", "Senior Backend Developer", "QA Engineer", "Product Manager"]
+LOCATIONS = ["Kuala Lumpur", "Singapore", "Makati City, Manila", "Jakarta"]
+
+def synthetic_email(kind, company, position, sent, applied, applicants=42, location="Kuala Lumpur", link="https://www.jobstreet.com/job/12345"):
+    # The three JobStreet templates the extractors expect: multipart/alternative with a
+    # quoted-printable text/plain part and an HTML part
+    if kind == "submitted":
+        subject = "Your application was successfully submitted"
+        text = (f"Hi there,\n\nYour application for {position} was successfully submitted to {company}. Each "
+                f"employer reviews applications differently.\n\n{position} [ {link} ]\n{company}\n{location}\n\n(c) SEEK Limited\n")
+    elif kind == "viewed":
+        subject = f"{company} has viewed your application for {position}"
+        text = (f"Good news!\n\nYour application for {position} was viewed by {company}. Each employer reviews "
+                f"applications differently.\n\nApplied on {applied.day} {applied.strftime('%b')}\n\nSimilar jobs you might like\n")
+    else:
+        subject = f"{position} at {company} has closed"
+        text = (f"Hi,\n\nWe wanted to let you know the {position} job you applied for at {company} has expired.\n\n"
+                f"Applied on {applied.day} {applied.strftime('%b')}\n\nApplication information [ {link} ]\n{applicants} candidates applied\n")
+
+    boundary = f"=============={random.getrandbits(64):020d}=="
+    html = "<html><body><p>" + text.replace("\n", "<br>") + "</p>" + "<img src='x'>" * 20 + "</body></html>"
+    message = (
+        f'Content-Type: multipart/alternative; boundary="{boundary}"\n'
+        f"MIME-Version: 1.0\n"
+        f"From: JobStreet <noreply@jobstreet.com>\n"
+        f"Subject: {subject}\n"
+        f"Date: {format_datetime(sent)}\n\n"
+        f"--{boundary}\n"
+        f'Content-Type: text/plain; charset="utf-8"\n'
+        f"Content-Transfer-Encoding: quoted-printable\n\n"
+        f"{quopri.encodestring(text.encode()).decode()}\n"
+        f"--{boundary}\n"
+        f'Content-Type: text/html; charset="utf-8"\n'
+        f"Content-Transfer-Encoding: 7bit\n\n"
+        f"{html}\n"
+        f"--{boundary}--\n"
+    )
+    return message.replace("\n", "\r\n").encode()
+
+def synthetic_mailbox(count, seed=1):
+    # count messages: one submitted notification per application, a viewed one for every
+    # second application and a closed one for every third, arriving a few applications later.
+    # Applications spread over the year the extractor assumes for dates without one.
+    rng = random.Random(seed)
+    year = (datetime.today().replace(day=1) - timedelta(days=1)).year
+    start = datetime(year, 1, 1, 9, 0, tzinfo=timezone.utc)
+    step = timedelta(days=300) / max(1, count)
+
+    mailbox = FakeMailbox()
+    applications = []
+    expected = {"submitted": 0, "viewed": 0, "closed": 0}
+
+    def append(kind, application, sent, **kwargs):
+        company, position, applied = application
+        mailbox.append(synthetic_email(kind, company, position, sent, applied, **kwargs))
+        expected[kind] += 1
+
+    index = 0
+    while sum(expected.values()) < count:
+        sent = start + step * index
+        application = (rng.choice(COMPANIES), f"{rng.choice(POSITIONS)} {index}", sent)
+        applications.append(application)
+        append("submitted", application, sent, location=rng.choice(LOCATIONS))
+        if index >= 5 and (index - 5) % 2 == 0 and sum(expected.values()) < count:
+            append("viewed", applications[index - 5], sent)
+        if index >= 10 and (index - 10) % 3 == 0 and sum(expected.values()) < count:
+            append("closed", applications[index - 10], sent, applicants=rng.randint(1, 500))
+        index += 1
+    return mailbox, expected
+
+def write_template(file_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Applications"
+    ws.append(["Applications"])
+    ws.append(["UID", "Company", "Position", "Applied", "Viewed", "Closed", "Applicants", "Location", "Link"])
+    wb.save(file_path)
+
+def percentiles(samples, scale):
+    samples = sorted(samples)
+    if not samples:
+        return [0.0, 0.0, 0.0]
+    return [samples[min(len(samples) - 1, int(len(samples) * p))] * scale for p in (0.50, 0.95, 0.99)]
+
+def run_sync(count, args):
+    mailbox, expected = synthetic_mailbox(count, args.seed)
+    server = FakeIMAPServer(mailbox)
+    host, port = server.start()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_path = os.path.join(work_dir, "applications.xlsx")
+        write_template(file_path)
+        with open(os.path.join(work_dir, "config.ini"), "w") as f:
+            f.write(
+                f"[Settings]\nusername = bench\npassword = bench\nhost = {host}\nport = {port}\nssl = false\nfile_path = {file_path}\n"
+                f"[Criteria]\nfrom_email = jobstreet\nsince_date = 01-Jan-2000\n"
+                f"[Other]\nfetch_chunk_size = {args.chunk_size}\nfetch_mode = {args.fetch_mode}\nimap_connections = {args.connections}\n"
+                f"parse_workers = {args.parse_workers}\ncache_max_mb = 0\n"
+            )
+
+        # A full sync followed by an export, through the same entry point as the command line
+        cwd, argv = os.getcwd(), sys.argv
+        metrics.keep_samples = True
+        metrics.reset()
+        started = time.perf_counter()
+        try:
+            os.chdir(work_dir)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for command in (["sync"], ["export"]):
+                    sys.argv = ["jobstreet_applications.py"] + command
+                    jobstreet_applications.main()
+        finally:
+            os.chdir(cwd)
+            sys.argv = argv
+            server.shutdown()
+            server.server_close()
+        elapsed = time.perf_counter() - started
+
+    counters = metrics.snapshot()["counters"]
+    parse_samples = [mime + extract for mime, extract in zip(metrics.samples["mime"], metrics.samples["extract"])]
+    return {
+        "messages": count,
+        "seconds": elapsed,
+        "messages_per_second": count / elapsed,
+        "fetch_ms": percentiles(metrics.samples["fetch"], 1000),
+        "parse_us": percentiles(parse_samples, 1e6),
+        "fetched_bytes": counters.get("fetched_bytes", 0),
+        # The sync must find every row it was given, or the timing means nothing
+        "correct": (
+            counters.get("submitted_rows", 0) == expected["submitted"]
+            and counters.get("viewed_matched", 0) == expected["viewed"]
+            and counters.get("closed_matched", 0) == expected["closed"]
+        ),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Time a full sync and export against a synthetic mailbox on a local fake IMAP server")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated message counts to run")
+    parser.add_argument("--fetch-mode", choices=("text", "full"), default="text")
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--connections", type=int, default=1, help="IMAP sessions per pass")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON, e.g. to compare against a baseline")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'messages':>9} {'seconds':>9} {'msg/s':>8} {'fetch p50/p95/p99 ms':>22} {'parse p50/p95/p99 us':>22} {'MB':>7}  ok")
+    for count in (int(size) for size in args.sizes.split(",")):
+        result = run_sync(count, args)
+        results.append(result)
+        print(
+            f"{count:>9} {result['seconds']:>9.1f} {result['messages_per_second']:>8.0f} "
+            f"{'/'.join(f'{value:.1f}' for value in result['fetch_ms']):>22} "
+            f"{'/'.join(f'{value:.0f}' for value in result['parse_us']):>22} "
+            f"{result['fetched_bytes'] / 1024 / 1024:>7.1f}  {'yes' if result['correct'] else 'NO'}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
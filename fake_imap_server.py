@@ -0,0 +1,278 @@
+import bisect
+import email
+import re
+import socketserver
+import threading
+from datetime import datetime
+from email.parser import BytesHeaderParser
+from email.utils import parsedate_to_datetime
+
+# A small in-process IMAP4rev1 server for benchmarks and local runs. It implements
+# just what the sync sends (LOGIN, SELECT, STATUS, UID SEARCH, UID FETCH, IDLE,
+# LOGOUT) over one shared mailbox, without TLS or authentication.
+
+class FakeMailbox:
+    def __init__(self, uidvalidity=1):
+        self.uidvalidity = uidvalidity
+        # uid -> (raw message, headers, INTERNALDATE); the MIME tree is only built on first fetch
+        self.messages = {}
+        self.uids = []
+        self.parsed = {}
+        self.next_uid = 1
+        self.changed = threading.Condition()
+
+    def append(self, raw_message, internal_date=None):
+        headers = BytesHeaderParser().parsebytes(raw_message)
+        headers = {name: headers[name] for name in ("Subject", "From", "Date") if headers[name] is not None}
+        if internal_date is None:
+            internal_date = parsedate_to_datetime(headers["Date"]) if "Date" in headers else datetime.now().astimezone()
+
+        with self.changed:
+            uid = self.next_uid
+            self.next_uid += 1
+            self.messages[uid] = (raw_message, headers, internal_date)
+            self.uids.append(uid)
+            self.changed.notify_all()
+        return uid
+
+    def structure(self, uid):
+        # (BODYSTRUCTURE, {section: payload}) for one message, built once
+        if uid not in self.parsed:
+            msg = email.message_from_bytes(self.messages[uid][0])
+            sections = {}
+            self.parsed[uid] = (body_structure(msg, sections), sections)
+        return self.parsed[uid]
+
+def tokenize(text):
+    tokens = re.findall(r'"(?:[^"\\]|\\.)*"|\(|\)|[^\s()]+', text)
+    return [token[1:-1].replace('\\"', '"') if token.startswith('"') else token for token in tokens]
+
+def uid_ranges(uid_set, max_uid):
+    for part in uid_set.split(","):
+        first, _, last = part.partition(":")
+        first = max_uid if first == "*" else int(first)
+        last = first if not last else (max_uid if last == "*" else int(last))
+        yield min(first, last), max(first, last)
+
+def quote(value):
+    if value is None:
+        return "NIL"
+    return '"%s"' % str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def body_structure(part, sections, section=""):
+    if part.is_multipart():
+        children = "".join(
+            body_structure(child, sections, f"{section}.{index}" if section else str(index))
+            for index, child in enumerate(part.get_payload(), 1)
+        )
+        return "(%s %s)" % (children, quote(part.get_content_subtype()))
+
+    payload = part.get_payload()
+    sections[section or "1"] = payload.encode()
+    params = part.get_params() or []
+    params = " ".join(f"{quote(key)} {quote(value)}" for key, value in params[1:])
+    fields = [
+        quote(part.get_content_maintype()),
+        quote(part.get_content_subtype()),
+        f"({params})" if params else "NIL",
+        "NIL",
+        "NIL",
+        quote(part.get("Content-Transfer-Encoding", "7bit")),
+        str(len(payload.encode())),
+    ]
+    if part.get_content_maintype() == "text":
+        fields.append(str(payload.count("\n")))
+    return "(%s)" % " ".join(fields)
+
+class FakeIMAPHandler(socketserver.StreamRequestHandler):
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.wfile.write(data + b"\r\n")
+
+    def handle(self):
+        self.mailbox = self.server.mailbox
+        # Messages this session has been told about; like a real server, growth past it is
+        # announced with "* n EXISTS" before the reply to the next command
+        self.known = 0
+        self.send("* OK [CAPABILITY IMAP4rev1 IDLE] fake IMAP ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode().rstrip("\r\n").partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            if command == "UID":
+                command, _, args = args.partition(" ")
+                command = "UID " + command.upper()
+            handler = getattr(self, "do_" + command.replace(" ", "_"), None)
+            if command not in ("SELECT", "EXAMINE", "IDLE"):
+                self.announce()
+            if handler is None:
+                self.send(f"{tag} BAD unknown command")
+                continue
+            if handler(tag, args) is False:
+                return
+
+    def announce(self):
+        with self.mailbox.changed:
+            if len(self.mailbox.messages) != self.known:
+                self.known = len(self.mailbox.messages)
+                self.send(f"* {self.known} EXISTS")
+
+    def do_CAPABILITY(self, tag, args):
+        self.send("* CAPABILITY IMAP4rev1 IDLE")
+        self.send(f"{tag} OK CAPABILITY completed")
+
+    def do_LOGIN(self, tag, args):
+        self.send(f"{tag} OK LOGIN completed")
+
+    def do_NOOP(self, tag, args):
+        self.send(f"{tag} OK NOOP completed")
+
+    def do_SELECT(self, tag, args):
+        with self.mailbox.changed:
+            self.known = len(self.mailbox.messages)
+            self.send(f"* {self.known} EXISTS")
+            self.send(f"* OK [UIDVALIDITY {self.mailbox.uidvalidity}] UIDs valid")
+            self.send(f"* OK [UIDNEXT {self.mailbox.next_uid}] next UID")
+        self.send(f"{tag} OK [READ-WRITE] SELECT completed")
+
+    do_EXAMINE = do_SELECT
+
+    def do_STATUS(self, tag, args):
+        folder = tokenize(args)[0]
+        self.send(f"* STATUS {quote(folder)} (UIDVALIDITY {self.mailbox.uidvalidity} UIDNEXT {self.mailbox.next_uid})")
+        self.send(f"{tag} OK STATUS completed")
+
+    def do_LOGOUT(self, tag, args):
+        self.send("* BYE logging out")
+        self.send(f"{tag} OK LOGOUT completed")
+        return False
+
+    def do_IDLE(self, tag, args):
+        # Pushes "* n EXISTS" whenever the mailbox grows, until the client sends DONE
+        self.send("+ idling")
+        self.wfile.flush()
+        stop = threading.Event()
+
+        def notify():
+            with self.mailbox.changed:
+                while not stop.is_set():
+                    self.announce()
+                    self.wfile.flush()
+                    self.mailbox.changed.wait(0.1)
+
+        watcher = threading.Thread(target=notify, daemon=True)
+        watcher.start()
+        self.rfile.readline()
+        stop.set()
+        watcher.join()
+        self.send(f"{tag} OK IDLE terminated")
+
+    def matches(self, tokens, uid, headers, internal_date, max_uid):
+        key = tokens.pop(0).upper()
+        if key == "(":
+            result = True
+            while tokens[0] != ")":
+                result = self.matches(tokens, uid, headers, internal_date, max_uid) and result
+            tokens.pop(0)
+            return result
+        if key == "OR":
+            left = self.matches(tokens, uid, headers, internal_date, max_uid)
+            right = self.matches(tokens, uid, headers, internal_date, max_uid)
+            return left or right
+        if key == "ALL":
+            return True
+        if key in ("SUBJECT", "FROM"):
+            needle = tokens.pop(0).lower()
+            return needle in headers.get(key.title(), "").lower()
+        if key == "SINCE":
+            return internal_date.date() >= datetime.strptime(tokens.pop(0), "%d-%b-%Y").date()
+        if key == "UID":
+            return any(first <= uid <= last for first, last in uid_ranges(tokens.pop(0), max_uid))
+        raise ValueError(f"unsupported search key {key}")
+
+    def do_UID_SEARCH(self, tag, args):
+        tokens = tokenize(args)
+        if tokens[0].upper() == "CHARSET":
+            tokens = tokens[2:]
+        with self.mailbox.changed:
+            messages = dict(self.mailbox.messages)
+        max_uid = max(messages, default=0)
+        found = []
+        for uid, (raw_message, headers, internal_date) in sorted(messages.items()):
+            remaining = list(tokens)
+            matched = True
+            while remaining:
+                matched = self.matches(remaining, uid, headers, internal_date, max_uid) and matched
+            if matched:
+                found.append(str(uid))
+        self.send("* SEARCH " + " ".join(found) if found else "* SEARCH")
+        self.send(f"{tag} OK SEARCH completed")
+
+    def do_UID_FETCH(self, tag, args):
+        uid_set, _, items = args.partition(" ")
+        items = items.strip()
+        if items.startswith("(") and items.endswith(")"):
+            items = items[1:-1]
+        items = re.findall(r"BODY(?:\.PEEK)?\[[^\]]*\]|\S+", items, re.IGNORECASE)
+
+        with self.mailbox.changed:
+            uids = list(self.mailbox.uids)
+        max_uid = uids[-1] if uids else 0
+        requested = sorted({
+            uids[seq]
+            for first, last in uid_ranges(uid_set, max_uid)
+            for seq in range(bisect.bisect_left(uids, first), bisect.bisect_right(uids, last))
+        })
+        for uid in requested:
+            raw_message, headers, internal_date = self.mailbox.messages[uid]
+            response = f"* {bisect.bisect_left(uids, uid) + 1} FETCH (UID {uid}".encode()
+            for item in items:
+                upper = item.upper()
+                if upper == "UID":
+                    continue
+                if upper in ("RFC822", "BODY[]", "BODY.PEEK[]"):
+                    literal = raw_message
+                    name = "RFC822" if upper == "RFC822" else "BODY[]"
+                elif upper == "BODYSTRUCTURE":
+                    response += f" BODYSTRUCTURE {self.mailbox.structure(uid)[0]}".encode()
+                    continue
+                elif upper == "INTERNALDATE":
+                    response += f' INTERNALDATE "{internal_date.strftime("%d-%b-%Y %H:%M:%S %z")}"'.encode()
+                    continue
+                elif upper == "ENVELOPE":
+                    envelope = [quote(headers.get("Date")), quote(headers.get("Subject"))] + ["NIL"] * 8
+                    response += f" ENVELOPE ({' '.join(envelope)})".encode()
+                    continue
+                else:
+                    section = re.search(r"\[(.*)\]", item).group(1)
+                    name = f"BODY[{section}]"
+                    fields = re.match(r"HEADER\.FIELDS \((.*)\)", section, re.IGNORECASE)
+                    if fields:
+                        literal = b"".join(
+                            f"{field.title()}: {headers[field.title()]}\r\n".encode()
+                            for field in fields.group(1).split() if field.title() in headers
+                        ) + b"\r\n"
+                    elif section.upper() == "HEADER":
+                        literal = raw_message.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+                    else:
+                        literal = self.mailbox.structure(uid)[1].get(section, b"")
+                response += f" {name} {{{len(literal)}}}\r\n".encode() + literal
+            self.send(response + b")")
+        self.send(f"{tag} OK FETCH completed")
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox, address=("127.0.0.1", 0)):
+        self.mailbox = mailbox
+        super().__init__(address, FakeIMAPHandler)
+
+    def start(self):
+        # Serves on a daemon thread; returns the (host, port) it listens on
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address
@@ -1,45 +1,53 @@
-import imaplib
-from itertools import chain
-import email
-from email.header import decode_header
-import openpyxl
-from openpyxl.styles import Alignment
-from datetime import datetime
-from datetime import timedelta
-import re
-from bs4 import BeautifulSoup
-import quopri
-import unicodedata
+import argparse
 import configparser
-import io
+import errno
 import sys
 import os
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple
+from jobstreet_metrics import metrics
+
+# Everything that talks to the mail server or the workbook (imaplib, email, openpyxl)
+# is imported by the command that needs it, so stats and check-config start fast
+PASS_NAMES = ("submitted", "viewed", "closed")
 
 def main():
+    parser = argparse.ArgumentParser(description="Track JobStreet applications from Yahoo Mail in an Excel sheet")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    
+    reporting = argparse.ArgumentParser(add_help=False)
+    reporting.add_argument("--metrics-json", metavar="PATH", help="write the run's stage timings and counters as JSON")
+    reporting.add_argument("--metrics-prom", metavar="PATH", help="write the run's stage timings and counters in Prometheus textfile format")
+    
+    sync = commands.add_parser("sync", parents=[reporting], help="fetch new JobStreet mail into the application store (the default)")
+    sync.add_argument("--only", action="append", choices=PASS_NAMES, help="run only this pass; repeat it to run several. Viewed and closed mail is matched against the rows already stored, so run submitted first")
+    sync.add_argument("--reparse-from-cache", action="store_true", help="rebuild the store from the local message cache without connecting to the mail server. "
+                      "Rows a cached viewed or closed notice matches get their dates from it again; other rows keep theirs")
+    sync.add_argument("--watch", action="store_true", help="after syncing, stay connected and apply new JobStreet mail as it arrives (IMAP IDLE)")
+    sync.add_argument("--export", action="store_true", help="write the Excel sheet after syncing, as a run without a command does")
+    sync.add_argument("-v", "--verbose", action="count", default=0, help="print every message as it is applied")
+    sync.set_defaults(run=sync_command)
+    
+    export = commands.add_parser("export", parents=[reporting], help="write the stored applications to the Excel sheet without syncing")
+    export.set_defaults(run=export_command)
+    
+    stats = commands.add_parser("stats", help="print row counts, sync marks and cache size without connecting to anything")
+    stats.set_defaults(run=stats_command)
+    
+    check_config = commands.add_parser("check-config", help="validate config.ini without connecting to the mail server")
+    check_config.set_defaults(run=check_config_command)
+    
+    args = parser.parse_args(command_line(sys.argv[1:]))
+    
     try:
-        config = load_config()
-
-        file_path = config.get("Settings", "file_path")
-        with io.open(file_path, "r"):
-            pass
-        is_file_open(file_path)
+        args.run(args)
             
-        username = config.get("Settings", "username")
-        password = config.get("Settings", "password")
-
-        criteria = {
-            "FROM": config.get("Criteria", "from_email"),
-            "SINCE": config.get("Criteria", "since_date"),
-        }
-
-        uid_max = config.getint("Other", "uid_max")
-        
-        submitted_applications(file_path, username, password, uid_max, criteria)
-        viewed_applications(file_path, username, password, uid_max, criteria)
-        closed_applications(file_path, username, password, uid_max, criteria)
-        
     except PermissionError as e:
-        print(f"Error: Unable to access '{file_path}' due to permission issues.")
+        print(f"Error: Unable to access '{e.filename}' due to permission issues.")
         print("Possible Solutions:")
         print("1. Close the file if it's open in Excel or another program.")
         print("2. Check file permissions and ensure you have access.")
@@ -50,440 +58,288 @@ def main():
     except Exception as e:
         print(f"Unexpected error: {e}")
         sys.exit(1)
-        
-def is_file_open(file_path):
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Error: The file '{file_path}' does not exist.")
 
-    try:
-        wb = openpyxl.load_workbook(file_path)
-        wb.save(file_path)
-    except PermissionError as e:
-        print(f"Error: Unable to access '{file_path}' due to permission issues.")
-        print("Possible Solutions:")
-        print("1. Close the file if it's open in Excel or another program.")
-        print("2. Check file permissions and ensure you have access.")
-        print("3. Try running the script as Administrator.")
-        print(f"Technical Details: {e}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        sys.exit(1)
-    
-def load_config(file_name="config.ini"):
-    config = configparser.ConfigParser()
-    config.read(file_name)
-    return config
-
-def format_email_date(email_date):
-    email_date_str = email_date.split(" (")[0]
-    email_date_obj = datetime.strptime(email_date_str, "%a, %d %b %Y %H:%M:%S %z")
-    return email_date_obj.strftime("%Y-%m-%d")
+def command_line(argv):
+    # Before the subcommands a bare run synced and updated the sheet, and --export only exported;
+    # cron jobs still call it that way. --watch updates the sheet as it goes.
+    if argv and (not argv[0].startswith("-") or argv[0] in ("-h", "--help")):
+        return argv
+    if "--export" in argv:
+        return ["export"] + [arg for arg in argv if arg != "--export"]
+    if "--watch" in argv:
+        return ["sync"] + argv
+    return ["sync", "--export"] + argv
 
-def format_application_date(new_date):
-    cleaned_date = unicodedata.normalize("NFKC", new_date)
-    cleaned_date = re.sub(r'\s+', ' ', cleaned_date).strip()
-    cleaned_date = re.sub(r'(\d)\s+(\d)', r'\1\2', cleaned_date)
-    cleaned_date = re.sub(r'(\w)\s+(\w)', r'\1\2', cleaned_date)  
+def sync_command(args):
+    import concurrent.futures
+    from jobstreet_cache import MessageCache
+    from jobstreet_sync import FetchOptions, sync_accounts, reparse_from_cache, apply_results
     
-    has_year = re.search(r'\d{4}', cleaned_date)
-
-    if has_year:
-        formatted_date = datetime.strptime(cleaned_date, "%d %b %Y").strftime("%Y-%m-%d")
-    else:
-        match = re.search(r"^(.*?)\s*(?:Applicationinformation|Similarjobsyoumight)", cleaned_date, re.IGNORECASE)
-        if match:
-            cleaned_date = match.group(1).strip()
-            # cleaned_date = re.sub(r"(\d{1,2})\s*([A-Za-z]{1})\s*([A-Za-z]{2})", r"\1 \2\3", cleaned_date)
-        # else:
-            # cleaned_date = re.sub(r"(\d{1,2})([A-Za-z]{3})", r"\1 \2", cleaned_date)
-        cleaned_date = re.sub(r"(\d{1,2})\s*([A-Za-z]{1})\s*([A-Za-z]{2})", r"\1 \2\3", cleaned_date)
-        cleaned_date = re.sub(r"\b([A-Za-z])\s+([A-Za-z])\b", r"\1\2", cleaned_date)
-        cleaned_date = re.sub(r"(\d{1,2})([A-Za-z]{3})", r"\1 \2", cleaned_date)
-            
-        one_month_ago = datetime.today().replace(day=1) - timedelta(days=1) 
-        assumed_year = one_month_ago.year
-        
-        full_date = f"{cleaned_date} {assumed_year}"
-        formatted_date = datetime.strptime(full_date, "%d %b %Y").strftime("%Y-%m-%d")
-        
-    return formatted_date
+    config = load_config()
+    accounts = load_accounts(config)
 
-def search_string(uid_max, criteria):
-    c = list(map(lambda t: (t[0], '"'+str(t[1])+'"'), criteria.items())) + [('UID', '%d:*' % (uid_max+1))]
-    return '(%s)' % ' '.join(chain(*c))
-
-def submitted_applications(file_path, username, password, uid_max, criteria):
-
-    print(f"\nFetching submitted applications")
+    uid_max = config.getint("Other", "uid_max", fallback=0)
+    state_path = config.get("Other", "state_file", fallback="sync_state.json")
+    options = FetchOptions(
+        chunk_size=config.getint("Other", "fetch_chunk_size", fallback=200),
+        fetch_mode=config.get("Other", "fetch_mode", fallback="text"),
+        connections=config.getint("Other", "imap_connections", fallback=1),
+        plan_fetches=config.getboolean("Other", "fetch_planner", fallback=True),
+        passes=tuple(name for name in PASS_NAMES if name in args.only) if args.only else PASS_NAMES,
+    )
+    max_connections = config.getint("Other", "max_connections", fallback=4)
+    parse_workers = config.getint("Other", "parse_workers", fallback=os.cpu_count() or 1)
+    cache_path = config.get("Other", "cache_file", fallback="message_cache.sqlite3")
+    cache_max_mb = config.getint("Other", "cache_max_mb", fallback=200)
+    flush_seconds = config.getint("Other", "watch_flush_seconds", fallback=30)
     
+    stores = open_stores(accounts)
+    if args.export:
+        # Found out before syncing rather than after
+        for file_path in stores:
+            if os.path.exists(file_path):
+                is_file_open(file_path)
+    state = load_sync_state(state_path)
+    cache = MessageCache(cache_path, cache_max_mb * 1024 * 1024) if cache_max_mb > 0 else None
+    executor = concurrent.futures.ProcessPoolExecutor(parse_workers) if parse_workers > 1 else None
     try:
-        imap_server = imaplib.IMAP4_SSL("imap.mail.yahoo.com", 993)
-        imap_server.login(username, password)
-        imap_server.select("INBOX")
-        
-        criteria['SUBJECT'] = 'Your application was successfully submitted'        
-        result, data = imap_server.uid('search', None, search_string(uid_max, criteria))
-        
-        start_row = 3
-        is_file_open(file_path)
-        wb = openpyxl.load_workbook(file_path)
-        ws = wb["Applications"]
+        if args.reparse_from_cache:
+            results = [
+                result for account in accounts
+                for result in reparse_from_cache(account, cache, state, executor, options.chunk_size, options.passes)
+            ]
+        else:
+            results = sync_accounts(accounts, stores, state, cache, executor, options, uid_max, max_connections)
+        apply_results(stores, results, rewrite=args.reparse_from_cache, verbose=args.verbose)
         
-        num_list = {0}
+        if args.watch:
+            # Commit the catch-up sync before waiting on new mail
+            for file_path, store in stores.items():
+                store.save()
+            save_sync_state(state_path, state)
+            watch_accounts(accounts, stores, state, state_path, cache, executor, options, flush_seconds, args.verbose)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if cache is not None:
+            cache.close()
         
-        for num in data[0].split():
-            num_int = int(num.decode())
-            
-            if num_int not in num_list:
-                result, msg_data = imap_server.uid('fetch', num, '(RFC822)')
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        
-                        subject = decode_header(msg["Subject"])[0][0]
-                        if isinstance(subject, bytes):
-                            subject = subject.decode()
-                            
-                        print("--------------------------------------------------------------------------------------")     
-                        print(f"UID: {num_int} | Subject: {subject}")
-                        
-                        if subject == 'Your application was successfully submitted':
-                            email_date = format_email_date(msg["Date"])
-                            
-                            ws.cell(row=start_row, column=1, value=num.decode())  # UID
-                            ws.cell(row=start_row, column=4, value=email_date).alignment = Alignment(horizontal='center')  # Date
-                            wb.save(file_path)
-                            
-                            if msg.is_multipart():
-                                for part in msg.walk():
-                                    content_type = part.get_content_type()
-                                    content_disposition = str(part.get("Content-Disposition"))
+    # The high-water marks only move once the rows they cover are on disk
+    with metrics.stage("save"):
+        for file_path, store in stores.items():
+            store.save()
+    if not args.reparse_from_cache:
+        save_sync_state(state_path, state)
+    if args.export:
+        export_stores(stores)
+    for file_path, store in stores.items():
+        store.close()
+    report_metrics(args)
+    if not args.watch and not args.export:
+        print("\nRun the export command to update the Excel sheet")
 
-                                    if content_type == "text/plain" and "attachment" not in content_disposition:
-                                        raw_email_text = part.get_payload(decode=True)
-                                        
-                            else:
-                                raw_email_text = msg.get_payload(decode=True)
-                                
-                            
-                            if raw_email_text:
-                                decoded_text = quopri.decodestring(raw_email_text).decode("utf-8")
-                                decoded_text = re.sub(r"=\n", "", decoded_text)
-                                decoded_text = re.sub(r"\s+", " ", decoded_text).strip()
-                            else:
-                                decoded_text = ""
-                                
-                            match = re.search(
-                                r"Your application for (.*?) was successfully submitted to (.*?)\. Each",
-                                decoded_text,
-                                re.DOTALL
-                            )
-                            
-                            position = ''
-                            company = ''
-                            job_link = ''
-                            location = ''
+def export_command(args):
+    accounts = load_accounts(load_config())
+    stores = open_stores(accounts)
+    export_stores(stores)
+    for file_path, store in stores.items():
+        store.close()
+    report_metrics(args)
 
-                            if match:
-                                position = match.group(1).strip()
-                                company = match.group(2).strip()
-                                
-                                position = re.sub(r"\s+", " ", position)
-                                company = re.sub(r"\s+", " ", re.sub(r"\.\.$", ".", company)).strip()
-                                
-                            # print(f"Extracted Position: {position}")
-                            # print(f"Extracted Company: {company}")
-                            
-                            # pattern = rf"{re.escape(position)}\s*\[\s*(https?://[^\]]+)\s*\]\s*{re.escape(company)}\s*(.*?)$"
-                            pattern = rf"{re.escape(position)}\s*\[\s*(https?://[^\]]+)\s*\]\s*{re.escape(company)}\s*([\w\s,-]+)"
-                            match = re.search(pattern, decoded_text, re.MULTILINE)
+def export_stores(stores):
+    from jobstreet_store import export_workbook
+    
+    for file_path, store in stores.items():
+        # A missing workbook is written fresh with a default header
+        if os.path.exists(file_path):
+            is_file_open(file_path)
+        with metrics.stage("export"):
+            export_workbook(store)
+        print(f"Exported {store.count()} applications to '{file_path}'")
 
-                            if match and company != '':
-                                job_link = match.group(1).strip()
-                                location = match.group(2).strip()
-                                location = re.sub(r"[^\w\s,.-]", "", location).strip()
-                                
-                            print(f"Date: {email_date}")
-                            print(f"Position: {position}")
-                            print(f"Company: {company}")
-                            print(f"Location: {location}")
-                            
-                            ws.cell(row=start_row, column=2, value=company)  # Company
-                            ws.cell(row=start_row, column=3, value=position)  # Position
-                            ws.cell(row=start_row, column=8, value=location)  # Location
-                            ws.cell(row=start_row, column=9, value=job_link)  # Link
-                            wb.save(file_path)
-                            start_row += 1
-            
-        wb.save(file_path)
-        imap_server.logout()
-            
-    except PermissionError as e:
-        print(f"Error: Unable to access '{file_path}' due to permission issues.")
-        print("Possible Solutions:")
-        print("1. Close the file if it's open in Excel or another program.")
-        print("2. Check file permissions and ensure you have access.")
-        print("3. Try running the script as Administrator.")
-        print(f"Technical Details: {e}")
-        sys.exit(1)
+def stats_command(args):
+    # Reads what earlier runs left behind and nothing else: no connection, no workbook,
+    # and a store that does not exist yet is reported rather than created
+    from jobstreet_store import ApplicationStore, store_path_for
+    
+    config = load_config()
+    accounts = load_accounts(config)
+    for file_path in dict.fromkeys(account.file_path for account in accounts):
+        if not os.path.exists(store_path_for(file_path)):
+            print(f"Workbook '{file_path}': no store yet, run a sync first")
+            continue
+        store = ApplicationStore(file_path)
+        summary = store.summary()
+        store.close()
+        print(
+            f"Workbook '{file_path}': {summary['rows']} applications, {summary['viewed']} viewed, "
+            f"{summary['closed']} closed, {summary['open']} still open"
+        )
+    
+    state_path = config.get("Other", "state_file", fallback="sync_state.json")
+    if os.path.exists(state_path):
+        state = load_sync_state(state_path)
+        last_sync = datetime.fromtimestamp(os.path.getmtime(state_path))
+        print(f"\nLast sync: {last_sync:%Y-%m-%d %H:%M:%S}")
+        for mailbox, marks in state["mailboxes"].items():
+            uids = ", ".join(f"{name} {marks.get(name, 0)}" for name in PASS_NAMES)
+            print(f"{mailbox}: last UIDs {uids} (UIDVALIDITY {marks.get('uidvalidity')})")
+    else:
+        print(f"\nNo sync state in '{state_path}' yet")
+    
+    cache_path = config.get("Other", "cache_file", fallback="message_cache.sqlite3")
+    if os.path.exists(cache_path):
+        print(f"Message cache '{cache_path}': {os.path.getsize(cache_path) / 1024 / 1024:.1f} MB")
 
-    except Exception as e:
-        print(f"Unexpected error: {e}")
+def check_config_command(args):
+    # Everything a sync would trip over in config.ini, reported together. Never
+    # connects, so a bad password only shows up on the next real sync.
+    problems = config_problems("config.ini")
+    for problem in problems:
+        print(f"Error: {problem}")
+    if problems:
         sys.exit(1)
-    
-    print("--------------------------------------------------------------------------------------")
-    print(f"Submitted applications added to the list")
-        
-def viewed_applications(file_path, username, password, uid_max, criteria):
+    print("Config OK")
 
-    print(f"\nFetching viewed applications")
+def config_problems(file_name="config.ini"):
+    if not os.path.exists(file_name):
+        return [f"'{file_name}' does not exist"]
     
     try:
-        imap_server = imaplib.IMAP4_SSL("imap.mail.yahoo.com", 993)
-        imap_server.login(username, password)
-        imap_server.select("INBOX")
-        
-        criteria['SUBJECT'] = 'has viewed your application for'        
-        result, data = imap_server.uid('search', None, search_string(uid_max, criteria))
-        
-        start_row = 3
-        is_file_open(file_path)
-        wb = openpyxl.load_workbook(file_path)
-        ws = wb["Applications"]
-        
-        num_list = {0}
+        config = load_config(file_name)
+    except configparser.Error as e:
+        return [str(e)]
+    
+    # Each account on its own, so one broken section does not hide the others
+    problems = []
+    for section in account_sections(config):
+        try:
+            account = load_account(config, section)
+        except (configparser.Error, ValueError) as e:
+            problems.append(f"[{section}] {e}")
+            continue
         
-        for num in data[0].split():
-            num_int = int(num.decode())
-            if num_int not in num_list:
-                result, msg_data = imap_server.uid('fetch', num, '(RFC822)')
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        
-                        subject = decode_header(msg["Subject"])[0][0]
-                        if isinstance(subject, bytes):
-                            subject = subject.decode()
-                        
-                        subject = re.sub(r"\s+", " ", subject)
-                            
-                        print("--------------------------------------------------------------------------------------")     
-                        print(f"UID: {num_int} | Subject: {subject}")
-                        
-                        position_search = ''
-                        company_search = ''
-                        application_date_search = ''
-                        row_number = ''
-                        
-                        email_date = format_email_date(msg["Date"])
-                        
-                        if msg.is_multipart():
-                            for part in msg.walk():
-                                content_type = part.get_content_type()
-                                content_disposition = str(part.get("Content-Disposition"))
+        if not account.username or not account.password:
+            problems.append(f"[{section}] username and password are required")
+        if not account.folders:
+            problems.append(f"[{section}] no folders to sync")
+        if not account.file_path:
+            problems.append(f"[{section}] file_path is not set")
+        elif not os.path.isdir(os.path.dirname(os.path.abspath(account.file_path))):
+            problems.append(f"[{section}] the folder of '{account.file_path}' does not exist")
+        try:
+            datetime.strptime(account.criteria["SINCE"], "%d-%b-%Y")
+        except ValueError:
+            problems.append(f"[{section}] since_date '{account.criteria['SINCE']}' is not like 01-Jan-2025")
+    
+    for option in ("uid_max", "fetch_chunk_size", "imap_connections", "max_connections", "parse_workers", "cache_max_mb", "watch_flush_seconds"):
+        try:
+            config.getint("Other", option, fallback=0)
+        except ValueError:
+            problems.append(f"[Other] {option} must be a whole number")
+    try:
+        config.getboolean("Other", "fetch_planner", fallback=True)
+    except ValueError:
+        problems.append("[Other] fetch_planner must be true or false")
+    if config.get("Other", "fetch_mode", fallback="text") not in ("text", "full"):
+        problems.append("[Other] fetch_mode must be text or full")
+    return problems
 
-                                if content_type == "text/plain" and "attachment" not in content_disposition:
-                                    raw_email_text = part.get_payload(decode=True)
-                                    
-                        else:
-                            raw_email_text = msg.get_payload(decode=True)
-                            
-                        
-                        if raw_email_text:
-                            decoded_text = quopri.decodestring(raw_email_text).decode("utf-8")
-                            decoded_text = re.sub(r"=\n", "", decoded_text)
-                            decoded_text = re.sub(r"\s+", " ", decoded_text).strip()
-                        else:
-                            decoded_text = ""
-                            
-                        match = re.search(
-                            r"Your application for (.*?) was viewed by (.*?)\. Each",
-                            decoded_text,
-                            re.DOTALL
-                        )
-                        
-                        if match:
-                            position_search = match.group(1).strip()
-                            company_search = match.group(2).strip()
-                            
-                            position_search = re.sub(r"\s+", " ", position_search)
-                            company_search = re.sub(r"\s+", " ", re.sub(r"\.\.$", ".", company_search)).strip()
-                            
-                        # match = re.search(r'Applied on\s+([\d]{1,2} [A-Za-z]+ \d{4})', decoded_text)
-                        match = re.search(r'Applied on\s+([\d\s]{1,4}[A-Za-z\s]+)(\d{4})?', decoded_text)
-                        
-                        if match:
-                            application_date_search = match.group(1).strip()
-                            application_date_search = format_application_date(application_date_search)
-                        
-                        matching_row = ''
-                        for row in range(2, ws.max_row + 1):
-                            company = ws.cell(row=row, column=2).value
-                            application_date = ws.cell(row=row, column=4).value
-                            position = ws.cell(row=row, column=3).value
-                            
-                            if isinstance(application_date, str):
-                                application_date = application_date.strip()
-                                
-                            if company == company_search and str(application_date) == application_date_search and position == position_search:
-                                matching_row = row
-                                break
-                                
-                        if matching_row:
-                            ws.cell(row=matching_row, column=5, value=email_date).alignment = Alignment(horizontal='center')  # Viewed date
-                            wb.save(file_path)
-                            
-                        print(f"Date: {email_date}")
-                        print(f"Position: {position}")
-                        print(f"Company: {company}")
-                        print(f"Application date: {application_date_search}")
-                            
-        imap_server.logout()
-            
-    except PermissionError as e:
-        print(f"Error: Unable to access '{file_path}' due to permission issues.")
-        print("Possible Solutions:")
-        print("1. Close the file if it's open in Excel or another program.")
-        print("2. Check file permissions and ensure you have access.")
-        print("3. Try running the script as Administrator.")
-        print(f"Technical Details: {e}")
-        sys.exit(1)
-        
-    except Exception as e:
-        raise Exception("Error while connecting to the Yahoo email server.") from e
-        sys.exit(1)
-        
-    print("--------------------------------------------------------------------------------------")
-    print(f"Viewed applications updated")
+def open_stores(accounts):
+    # One store per workbook; the workbook itself is only touched by export
+    from jobstreet_store import ApplicationStore
+    
+    stores = {}
+    for account in accounts:
+        if account.file_path not in stores:
+            stores[account.file_path] = ApplicationStore(account.file_path)
+        for folder in account.folders:
+            stores[account.file_path].add_source(f"{account.username}/{folder}", f"{account.name}/{folder}")
+    return stores
         
-def closed_applications(file_path, username, password, uid_max, criteria):
+def report_metrics(args):
+    metrics.print_summary()
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
 
-    print(f"\nFetching viewed applications")
+def watch_accounts(accounts, stores, state, state_path, cache, executor, options, flush_seconds=30, verbose=0):
+    # One IDLE session per folder, each on its own thread, hands new records to this thread,
+    # which is the only one applying them. The sheets are re-exported at most every
+    # flush_seconds, and only when something changed. Runs until Ctrl+C.
+    from jobstreet_sync import watch_mailbox, apply_results
+    
+    # Watchers fetch while earlier batches may still wait in the queue, so a notice for a
+    # submission not applied yet would find no row and be skipped for good. New mail comes
+    # a few messages at a time, so the planner saves nothing here anyway.
+    options = options._replace(plan_fetches=False)
+    results = queue.Queue()
+    for account in accounts:
+        for folder in account.folders:
+            marks = dict(state["mailboxes"][f"{account.username}/{folder}"])
+            threading.Thread(
+                target=watch_mailbox,
+                args=(account, folder, stores[account.file_path], marks, cache, executor, options, results),
+                daemon=True,
+            ).start()
+    print(f"\nWatching {sum(len(account.folders) for account in accounts)} folder(s) for new JobStreet mail, press Ctrl+C to stop")
     
+    # Rows from the catch-up sync go out with the first flush
+    dirty = set(stores)
+    last_flush = 0
     try:
-        imap_server = imaplib.IMAP4_SSL("imap.mail.yahoo.com", 993)
-        imap_server.login(username, password)
-        imap_server.select("INBOX")
-        
-        criteria['SUBJECT'] = 'has closed'        
-        result, data = imap_server.uid('search', None, search_string(uid_max, criteria))
-        
-        start_row = 3
-        is_file_open(file_path)
-        wb = openpyxl.load_workbook(file_path)
-        ws = wb["Applications"]
-        
-        num_list = {0}
-        
-        for num in data[0].split():
-            num_int = int(num.decode())
-            if num_int not in num_list:
-                result, msg_data = imap_server.uid('fetch', num, '(RFC822)')
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        # print(msg)
-                        
-                        subject = decode_header(msg["Subject"])[0][0]
-                        if isinstance(subject, bytes):
-                            subject = subject.decode()
-                        
-                        subject = re.sub(r"\s+", " ", subject)
-                            
-                        print("--------------------------------------------------------------------------------------")     
-                        print(f"UID: {num_int} | Subject: {subject}")
-                        
-                        position_search = ''
-                        company_search = ''
-                        application_date_search = ''
-                        row_number = ''
-                        
-                        email_date = format_email_date(msg["Date"])
-                        
-                        if msg.is_multipart():
-                            for part in msg.walk():
-                                content_type = part.get_content_type()
-                                content_disposition = str(part.get("Content-Disposition"))
+        while True:
+            # Never block for long: on Windows Ctrl+C does not interrupt a waiting queue get
+            timeout = min(1, max(0, last_flush + flush_seconds - time.monotonic())) if dirty else 1
+            try:
+                item = results.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, BaseException):
+                raise item
+                
+            if item is not None:
+                account, mailbox, marks, records = item
+                apply_results(stores, [(account, mailbox, marks["uidvalidity"], records)], verbose=verbose)
+                stores[account.file_path].save()
+                # The watcher moved its marks when it fetched; they are kept once the rows are committed
+                state["mailboxes"][mailbox] = marks
+                save_sync_state(state_path, state)
+                dirty.add(account.file_path)
+                
+            if dirty and time.monotonic() - last_flush >= flush_seconds:
+                flush_workbooks(stores, dirty)
+                # A one-off sync trims the cache when it closes it; a watch may never get there
+                if cache is not None:
+                    cache.evict()
+                last_flush = time.monotonic()
+    except KeyboardInterrupt:
+        print("\nStopping watch")
+        flush_workbooks(stores, dirty)
+
+def flush_workbooks(stores, file_paths):
+    from jobstreet_store import export_workbook
+    
+    for file_path in sorted(file_paths):
+        try:
+            if os.path.exists(file_path):
+                check_workbook_unlocked(file_path)
+            with metrics.stage("export"):
+                export_workbook(stores[file_path])
+        except PermissionError as e:
+            # Someone has the sheet open; the store has the rows, try again on the next flush
+            print(f"Could not update '{file_path}', will retry: {e}")
+            continue
+        file_paths.discard(file_path)
+        print(f"Updated '{file_path}'")
 
-                                if content_type == "text/plain" and "attachment" not in content_disposition:
-                                    raw_email_text = part.get_payload(decode=True)
-                                    
-                        else:
-                            raw_email_text = msg.get_payload(decode=True)
-                            
-                        
-                        if raw_email_text:
-                            decoded_text = quopri.decodestring(raw_email_text).decode("utf-8")
-                            decoded_text = re.sub(r"=\n", "", decoded_text)
-                            decoded_text = re.sub(r"\s+", " ", decoded_text).strip()
-                        else:
-                            decoded_text = ""
-                            
-                        match = re.search(
-                            r"the (.*?) job you applied for at (.*?)\ has expired",
-                            decoded_text,
-                            re.DOTALL
-                        )
-                        
-                        if match:
-                            position_search = match.group(1).strip()
-                            company_search = match.group(2).strip()
-                            
-                            position_search = re.sub(r"\s+", " ", position_search)
-                            company_search = re.sub(r"\s+", " ", re.sub(r"\.\.$", ".", company_search)).strip()
-                            
-                        match = re.search(r'Applied on\s+([\d\s]{1,4}[A-Za-z\s]+)(\d{4})?', decoded_text)
-                        
-                        if match:
-                            application_date_search = match.group(1).strip()
-                            application_date_search = format_application_date(application_date_search)
-                            
-                        match = re.search(r"Application information\s*\[.*?\]\s*(\d+)\s+candidates applied", decoded_text, re.DOTALL)
+def is_file_open(file_path):
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Error: The file '{file_path}' does not exist.")
 
-                        if match:
-                            applicant_count = int(match.group(1))
-                            print(f"Applicant count: {applicant_count}")
-                        # else:
-                            # print(f"wala")
-                        
-                        matching_row = ''
-                        for row in range(2, ws.max_row + 1):
-                            company = ws.cell(row=row, column=2).value
-                            application_date = ws.cell(row=row, column=4).value
-                            position = ws.cell(row=row, column=3).value
-                            
-                            if isinstance(application_date, str):
-                                application_date = application_date.strip()
-                            
-                            # Consider possibility of companies changing their name
-                            if company == company_search and str(application_date) == str(application_date_search) and position == position_search:
-                                matching_row = row
-                                break
-                            elif str(application_date) == str(application_date_search) and position == position_search:
-                                matching_row = row
-                                break
-                            elif company == company_search and position == position_search:
-                                matching_row = row
-                                break
-                            # if company == company_search:
-                            # if str(application_date) == str(application_date_search) and position == position_search:
-                                # matching_row = row
-                                # break
-                                
-                        if matching_row:
-                            ws.cell(row=matching_row, column=6, value=email_date).alignment = Alignment(horizontal='center')  # Closed date
-                            ws.cell(row=matching_row, column=7, value=applicant_count).alignment = Alignment(horizontal='center')  # Applicants
-                            wb.save(file_path)
-                            
-                        print(f"Date: {email_date}")
-                        print(f"Position: {position_search}")
-                        print(f"Company: {company_search}")
-                        # print(f"Application date 1: {application_date}")
-                        print(f"Application date: {application_date_search}")
-                        
-        imap_server.logout()
-        
+    try:
+        check_workbook_unlocked(file_path)
     except PermissionError as e:
         print(f"Error: Unable to access '{file_path}' due to permission issues.")
         print("Possible Solutions:")
@@ -492,13 +348,79 @@ def closed_applications(file_path, username, password, uid_max, criteria):
         print("3. Try running the script as Administrator.")
         print(f"Technical Details: {e}")
         sys.exit(1)
-        
     except Exception as e:
-        raise Exception("Error while connecting to the Yahoo email server.") from e
+        print(f"Unexpected error: {e}")
         sys.exit(1)
-        
-    print("--------------------------------------------------------------------------------------")
-    print(f"Closed applications updated")
+    
+def check_workbook_unlocked(file_path):
+    # Excel keeps a "~$name.xlsx" owner file next to workbooks it has open, and on
+    # Windows opening a locked file for writing fails straight away
+    owner_file = os.path.join(os.path.dirname(file_path), "~$" + os.path.basename(file_path))
+    if os.path.exists(owner_file):
+        raise PermissionError(errno.EACCES, f"'{owner_file}' exists, the workbook is open in another program", file_path)
+    with open(file_path, "r+b"):
+        pass
+    
+class Account(NamedTuple):
+    name: str
+    username: str
+    password: str
+    host: str
+    port: int
+    use_ssl: bool
+    folders: tuple
+    file_path: str
+    criteria: dict
+
+def load_config(file_name="config.ini"):
+    config = configparser.ConfigParser()
+    config.read(file_name)
+    return config
+
+def load_accounts(config):
+    # Either one [Account <name>] section per mailbox owner, or the original
+    # [Settings] block as a single account. [Settings] and [Criteria] supply defaults.
+    accounts = []
+    for section in account_sections(config):
+        accounts.append(load_account(config, section))
+    return accounts
+
+def account_sections(config):
+    return [section for section in config.sections() if section.startswith("Account ")] or ["Settings"]
+
+def load_account(config, section):
+    folders = config.get(section, "folders", fallback="INBOX")
+    criteria = {
+        "FROM": config.get(section, "from_email", fallback=config.get("Criteria", "from_email", fallback=None)),
+        "SINCE": config.get(section, "since_date", fallback=config.get("Criteria", "since_date", fallback=None)),
+    }
+    # Both go into every search; a missing one would be searched for as "None"
+    for key, option in (("FROM", "from_email"), ("SINCE", "since_date")):
+        if criteria[key] is None:
+            raise configparser.NoOptionError(option, "Criteria")
+    return Account(
+        name=section[len("Account "):].strip() if section != "Settings" else "default",
+        username=config.get(section, "username"),
+        password=config.get(section, "password"),
+        host=config.get(section, "host", fallback=config.get("Settings", "host", fallback="imap.mail.yahoo.com")),
+        port=config.getint(section, "port", fallback=config.getint("Settings", "port", fallback=993)),
+        use_ssl=config.getboolean(section, "ssl", fallback=config.getboolean("Settings", "ssl", fallback=True)),
+        folders=tuple(folder.strip() for folder in folders.split(",") if folder.strip()),
+        file_path=config.get(section, "file_path", fallback=config.get("Settings", "file_path", fallback=None)),
+        criteria=criteria,
+    )
+
+def load_sync_state(state_path):
+    if not os.path.exists(state_path):
+        return {"mailboxes": {}}
+    with open(state_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_sync_state(state_path, state):
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, state_path)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,108 @@
+import hashlib
+import heapq
+import sqlite3
+import threading
+import time
+from jobstreet_metrics import metrics
+
+class MessageCache:
+    # Fetched messages, stored once per content hash and looked up by
+    # (mailbox, UIDVALIDITY, UID). Least recently used blobs go first once
+    # the cache grows past max_bytes.
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # The fetch stage writes from its own thread, hence check_same_thread=False and the lock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS blobs_accessed ON blobs (accessed);
+            CREATE TABLE IF NOT EXISTS messages (
+                mailbox TEXT NOT NULL,
+                uidvalidity INTEGER NOT NULL,
+                uid INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                PRIMARY KEY (mailbox, uidvalidity, uid)
+            );
+            CREATE INDEX IF NOT EXISTS messages_digest ON messages (digest);
+        """)
+
+    def get_many(self, mailbox, uidvalidity, uids):
+        found = {}
+        uids = sorted({int(uid) for uid in uids})
+        with self.lock:
+            for i in range(0, len(uids), 500):
+                chunk = uids[i:i + 500]
+                rows = self.db.execute(
+                    f"SELECT m.uid, b.digest, b.data FROM messages m JOIN blobs b ON b.digest = m.digest "
+                    f"WHERE m.mailbox = ? AND m.uidvalidity = ? AND m.uid IN ({','.join('?' * len(chunk))})",
+                    [mailbox, uidvalidity, *chunk],
+                ).fetchall()
+                for uid, digest, data in rows:
+                    found[uid] = data
+                self.db.executemany("UPDATE blobs SET accessed = ? WHERE digest = ?", [(time.time(), digest) for uid, digest, data in rows])
+            self.db.commit()
+        return found
+
+    def put(self, mailbox, uidvalidity, uid, kind, data):
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO blobs (digest, data, size, accessed) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (digest) DO UPDATE SET accessed = excluded.accessed",
+                (digest, data, len(data), time.time()),
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO messages (mailbox, uidvalidity, uid, kind, digest) VALUES (?, ?, ?, ?, ?)",
+                (mailbox, uidvalidity, uid, kind, digest),
+            )
+
+    def messages(self, mailbox, uidvalidity, kind):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT m.uid, b.data FROM messages m JOIN blobs b ON b.digest = m.digest "
+                "WHERE m.mailbox = ? AND m.uidvalidity = ? AND m.kind = ? ORDER BY m.uid",
+                (mailbox, uidvalidity, kind),
+            ).fetchall()
+        return rows
+
+    def fetch(self, mailbox, uidvalidity, kind, uids, fetch_missing):
+        # Cached messages merged in UID order with the ones fetch_missing() still has to download
+        cached = self.get_many(mailbox, uidvalidity, uids)
+        missing = [uid for uid in uids if int(uid) not in cached]
+        metrics.count("cache_hits", len(cached))
+
+        def fetched():
+            for uid, data in fetch_missing(missing):
+                self.put(mailbox, uidvalidity, uid, kind, data)
+                yield uid, data
+            with self.lock:
+                self.db.commit()
+
+        return heapq.merge(sorted(cached.items()), fetched(), key=lambda message: message[0])
+
+    def evict(self):
+        with self.lock:
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self.db.execute("SELECT digest, size FROM blobs ORDER BY accessed").fetchall()
+                evicted = []
+                for digest, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((digest,))
+                    total -= size
+                self.db.executemany("DELETE FROM blobs WHERE digest = ?", evicted)
+                self.db.executemany("DELETE FROM messages WHERE digest = ?", evicted)
+            self.db.commit()
+
+    def close(self):
+        self.evict()
+        self.db.close()
@@ -0,0 +1,100 @@
+import functools
+import time
+import unicodedata
+from datetime import date, datetime, timedelta
+
+MONTHS = {month: number for number, month in enumerate(("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+WEEKDAYS = {"mon,", "tue,", "wed,", "thu,", "fri,", "sat,", "sun,"}
+# Text the "Applied on" match runs into after the month, once its spaces are gone
+DATE_TRAILERS = ("applicationinformation", "similarjobsyoumight")
+
+def assumed_year(today=None):
+    # "Applied on 12 Mar" has no year; the notifications arrive within weeks of applying,
+    # so take the year of last month
+    today = today or datetime.today()
+    return (today.replace(day=1) - timedelta(days=1)).year
+
+def is_clock(value):
+    # HH:MM:SS as strptime's %H:%M:%S takes it, two digits each
+    parts = value.split(":")
+    return (
+        len(parts) == 3 and all(len(part) == 2 and part.isdigit() and part.isascii() for part in parts)
+        and int(parts[0]) < 24 and int(parts[1]) < 60 and int(parts[2]) < 62
+    )
+
+def is_utc_offset(value):
+    return (
+        len(value) == 5 and value[0] in "+-" and value[1:].isdigit() and value[1:].isascii()
+        and int(value[1:3]) < 24 and int(value[3:]) < 60
+    )
+
+class DateNormalizer:
+    # Email and application dates to YYYY-MM-DD. The same few hundred strings come back
+    # on every run, so results are kept in bounded LRU caches. The assumed year for dates
+    # without one is worked out again whenever the month changes, since a --watch session
+    # can run into a new month or year; the cached application dates go with it.
+    def __init__(self, year=None, cache_size=1024):
+        self.fixed_year = year
+        self.month = None
+        self.cached_application_date = functools.lru_cache(maxsize=cache_size)(self.parse_application_date)
+        self.calendar_date = functools.lru_cache(maxsize=cache_size)(self.parse_calendar_date)
+        self.refresh()
+
+    def refresh(self, today=None):
+        month = (today or date.today()).replace(day=1)
+        if month != self.month:
+            self.month = month
+            self.year = self.fixed_year or assumed_year(month)
+            self.cached_application_date.cache_clear()
+        # Local midnight at the start of next month; until then a clock check is enough
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        self.expires = datetime(next_month.year, next_month.month, 1).timestamp()
+
+    def application_date(self, new_date):
+        if time.time() >= self.expires:
+            self.refresh()
+        return self.cached_application_date(new_date)
+
+    def email_date(self, email_date):
+        # "Thu, 12 Mar 2026 08:15:00 +0000 (UTC)". The time and zone are only checked, the
+        # date is kept as written, so only day, month and year go through the cache.
+        # Anything not in that exact shape goes to strptime as before.
+        email_date = email_date.split(" (")[0]
+        parts = email_date.split(" ")
+        if (
+            len(parts) == 6 and parts[0].lower() in WEEKDAYS and len(parts[1]) <= 2 and len(parts[3]) == 4
+            and is_clock(parts[4]) and is_utc_offset(parts[5])
+        ):
+            return self.calendar_date(parts[1], parts[2].lower(), parts[3])
+        return datetime.strptime(email_date, "%a, %d %b %Y %H:%M:%S %z").strftime("%Y-%m-%d")
+
+    def parse_calendar_date(self, day, month, year):
+        if not (day.isdigit() and day.isascii() and year.isdigit() and year.isascii()) or month not in MONTHS:
+            raise ValueError(f"time data '{day} {month} {year}' is not a date")
+        return date(int(year), MONTHS[month], int(day)).isoformat()
+
+    def parse_application_date(self, new_date):
+        # "12 Mar", and the same with stray spaces ("1 2 M ar") or the text after it
+        # ("12 Mar Similar jobs you might like"): drop all whitespace, then read the day
+        # digits and the three month letters
+        compact = "".join(unicodedata.normalize("NFKC", new_date).split())
+        digits = 0
+        while digits < len(compact) and "0" <= compact[digits] <= "9":
+            digits += 1
+        if not 1 <= digits <= 2:
+            raise ValueError(f"time data '{new_date}' does not start with a day of the month")
+
+        month = compact[digits:]
+        lowered = month.lower()
+        cut = min((lowered.find(trailer) for trailer in DATE_TRAILERS if trailer in lowered), default=-1)
+        if cut >= 0:
+            month = month[:cut]
+        month = month.lower()
+        if month not in MONTHS or not month.isascii():
+            raise ValueError(f"time data '{new_date}' does not have a month abbreviation")
+
+        return date(self.year, MONTHS[month], int(compact[:digits])).isoformat()
+
+# Shared by the extractors for the whole run; each parse worker builds its own on import,
+# and every copy keeps its year current on its own
+dates = DateNormalizer()
@@ -0,0 +1,205 @@
+import email
+from email.header import decode_header
+from email.message import Message
+from typing import NamedTuple, Optional
+import re
+import quopri
+import time
+from jobstreet_dates import dates
+
+SUBJECTS = {
+    "submitted": 'Your application was successfully submitted',
+    "viewed": 'has viewed your application for',
+    "closed": 'has closed',
+}
+
+# One set of patterns per JobStreet template, compiled once at import. They run on the
+# body after it has been collapsed to single spaces, so none of them need re.DOTALL.
+SUBMITTED_RE = re.compile(r"Your application for (.*?) was successfully submitted to (.*?)\. Each")
+VIEWED_RE = re.compile(r"Your application for (.*?) was viewed by (.*?)\. Each")
+CLOSED_RE = re.compile(r"the (.*?) job you applied for at (.*?) has expired")
+APPLIED_ON_RE = re.compile(r"Applied on\s+([\d\s]{1,4}[A-Za-z\s]+)(\d{4})?")
+APPLICANTS_RE = re.compile(r"Application information\s*\[.*?\]\s*(\d+)\s+candidates applied")
+# "<position> [ <link> ] <company> <location>" block of the submitted template
+JOB_LINK_RE = re.compile(r"\s*\[\s*(https?://[^\]]+)\s*\]\s*")
+LOCATION_RE = re.compile(r"\s*([\w\s,-]+)")
+LOCATION_JUNK_RE = re.compile(r"[^\w\s,.-]")
+TRAILING_DOTS_RE = re.compile(r"\.\.$")
+WHITESPACE_RE = re.compile(r"\s+")
+
+class ApplicationEmail(NamedTuple):
+    kind: str
+    uid: int
+    subject: str
+    email_date: str = ''
+    position: str = ''
+    company: str = ''
+    application_date: str = ''
+    location: str = ''
+    job_link: str = ''
+    applicant_count: Optional[int] = None
+
+def format_email_date(email_date):
+    return dates.email_date(email_date)
+
+def format_application_date(new_date):
+    return dates.application_date(new_date)
+
+def as_message(raw_email):
+    # The extractors take the raw bytes, or a message timed_extract has already parsed
+    if isinstance(raw_email, Message):
+        return raw_email
+    return email.message_from_bytes(raw_email)
+
+def subject_kind(subject):
+    # Same matching as IMAP SUBJECT search: case-insensitive substring
+    subject = " ".join(subject.split()).lower()
+    for kind, subject_search in SUBJECTS.items():
+        if subject_search.lower() in subject:
+            return kind
+    return None
+
+def subject_fields(kind, subject):
+    # (company, position) from a viewed or closed subject, before the body is fetched:
+    # "<company> has viewed your application for <position>" / "<position> at <company> has closed".
+    # None when the subject cannot be split with certainty, e.g. truncated or more than one " at ".
+    subject = " ".join(subject.split())
+    if subject.endswith(("...", "\u2026")):
+        return None
+    lowered = subject.lower()
+
+    if kind == "viewed":
+        marker = " has viewed your application for "
+        at = lowered.find(marker)
+        if at <= 0 or lowered.find(marker, at + 1) >= 0:
+            return None
+        company, position = subject[:at], subject[at + len(marker):]
+    elif kind == "closed":
+        if not lowered.endswith(" has closed"):
+            return None
+        rest = subject[:-len(" has closed")]
+        if rest.lower().count(" at ") != 1:
+            return None
+        position, company = rest[:rest.lower().find(" at ")], rest[rest.lower().find(" at ") + len(" at "):]
+    else:
+        return None
+
+    if not company or not position:
+        return None
+    return company, position
+
+def email_subject(msg):
+    subject = decode_header(msg["Subject"])[0][0]
+    if isinstance(subject, bytes):
+        subject = subject.decode()
+    return subject
+
+def email_body_text(msg):
+    raw_email_text = None
+    if msg.is_multipart():
+        for part in msg.walk():
+            content_type = part.get_content_type()
+            content_disposition = str(part.get("Content-Disposition"))
+
+            if content_type == "text/plain" and "attachment" not in content_disposition:
+                raw_email_text = part.get_payload(decode=True)
+    else:
+        raw_email_text = msg.get_payload(decode=True)
+
+    if not raw_email_text:
+        return ""
+
+    # A single whitespace pass: drop leftover soft line breaks, then collapse every run
+    # of whitespace to one space (str.split() splits on the same characters as \s)
+    decoded_text = quopri.decodestring(raw_email_text).decode("utf-8")
+    return " ".join(decoded_text.replace("=\n", "").split())
+
+def position_and_company(pattern, decoded_text):
+    match = pattern.search(decoded_text)
+    if not match:
+        return '', ''
+
+    position = match.group(1).strip()
+    company = " ".join(TRAILING_DOTS_RE.sub(".", match.group(2).strip()).split())
+    return position, company
+
+def application_date(decoded_text):
+    match = APPLIED_ON_RE.search(decoded_text)
+    if not match:
+        return ''
+    return format_application_date(match.group(1).strip())
+
+def job_link_and_location(decoded_text, position, company):
+    # Leftmost "<position> [ <link> ] <company> <location>", without compiling a
+    # pattern around the escaped position and company for every message
+    start = decoded_text.find(position)
+    while start >= 0:
+        link = JOB_LINK_RE.match(decoded_text, start + len(position))
+        if link and decoded_text.startswith(company, link.end()):
+            location = LOCATION_RE.match(decoded_text, link.end() + len(company))
+            if location:
+                return link.group(1).strip(), LOCATION_JUNK_RE.sub("", location.group(1).strip()).strip()
+        start = decoded_text.find(position, start + 1)
+    return '', ''
+
+def extract_submitted(uid, raw_email):
+    msg = as_message(raw_email)
+    subject = email_subject(msg)
+
+    if subject != SUBJECTS["submitted"]:
+        return ApplicationEmail("submitted", uid, subject)
+
+    decoded_text = email_body_text(msg)
+    position, company = position_and_company(SUBMITTED_RE, decoded_text)
+    job_link, location = job_link_and_location(decoded_text, position, company) if company else ('', '')
+
+    return ApplicationEmail(
+        "submitted", uid, subject,
+        email_date=format_email_date(msg["Date"]),
+        position=position,
+        company=company,
+        location=location,
+        job_link=job_link,
+    )
+
+def extract_viewed(uid, raw_email):
+    msg = as_message(raw_email)
+    decoded_text = email_body_text(msg)
+    position, company = position_and_company(VIEWED_RE, decoded_text)
+
+    return ApplicationEmail(
+        "viewed", uid, WHITESPACE_RE.sub(" ", email_subject(msg)),
+        email_date=format_email_date(msg["Date"]),
+        position=position,
+        company=company,
+        application_date=application_date(decoded_text),
+    )
+
+def extract_closed(uid, raw_email):
+    msg = as_message(raw_email)
+    decoded_text = email_body_text(msg)
+    position, company = position_and_company(CLOSED_RE, decoded_text)
+    applicants = APPLICANTS_RE.search(decoded_text)
+
+    return ApplicationEmail(
+        "closed", uid, WHITESPACE_RE.sub(" ", email_subject(msg)),
+        email_date=format_email_date(msg["Date"]),
+        position=position,
+        company=company,
+        application_date=application_date(decoded_text),
+        applicant_count=int(applicants.group(1)) if applicants else None,
+    )
+
+EXTRACTORS = {
+    "submitted": extract_submitted,
+    "viewed": extract_viewed,
+    "closed": extract_closed,
+}
+
+def timed_extract(parse_email, uid, raw_email):
+    # The record plus the seconds spent on MIME parsing and on extraction, for the run metrics
+    started = time.perf_counter()
+    msg = email.message_from_bytes(raw_email)
+    parsed = time.perf_counter()
+    record = parse_email(uid, msg)
+    return record, parsed - started, time.perf_counter() - parsed
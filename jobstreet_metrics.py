@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Stages in the order a sync goes through them, for the summary
+STAGES = ("login", "search", "fetch", "mime", "extract", "match", "save", "export")
+
+class Metrics:
+    # Per-stage timers and plain counters for one run. Account and fetch threads all
+    # report here, so stage times are busy time summed across threads, not wall time.
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Every timed call is only kept on request, for the latency percentiles in
+        # bench_sync.py; a --watch session would otherwise grow them without end
+        self.keep_samples = False
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.samples = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds, calls=1):
+        with self.lock:
+            self.seconds[name] += seconds
+            self.calls[name] += calls
+            if self.keep_samples:
+                self.samples[name].append(seconds)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "elapsed_seconds": time.perf_counter() - self.started,
+                "stages": {name: {"seconds": self.seconds[name], "calls": self.calls[name]} for name in self.ordered_stages()},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def ordered_stages(self):
+        return [name for name in STAGES if name in self.calls] + sorted(name for name in self.calls if name not in STAGES)
+
+    def print_summary(self):
+        snapshot = self.snapshot()
+        print("\nRun summary")
+        print("--------------------------------------------------------------------------------------")
+        print(f"{'stage':<10} {'calls':>8} {'seconds':>10}")
+        for name, stage in snapshot["stages"].items():
+            print(f"{name:<10} {stage['calls']:>8} {stage['seconds']:>10.2f}")
+        for name, value in snapshot["counters"].items():
+            if name == "fetched_bytes":
+                print(f"{name}: {value} ({value / 1024 / 1024:.1f} MB)")
+            else:
+                print(f"{name}: {value}")
+        print(f"Total: {snapshot['elapsed_seconds']:.1f}s")
+
+    def write_json(self, path):
+        write_atomic(path, json.dumps(self.snapshot(), indent=2))
+
+    def write_prometheus(self, path):
+        # Textfile collector format; node_exporter picks up *.prom files from its directory
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP jobstreet_sync_seconds Wall time of the last run.",
+            "# TYPE jobstreet_sync_seconds gauge",
+            f"jobstreet_sync_seconds {snapshot['elapsed_seconds']:.6f}",
+            "# HELP jobstreet_stage_seconds Busy time per sync stage in the last run.",
+            "# TYPE jobstreet_stage_seconds gauge",
+        ]
+        lines += [f'jobstreet_stage_seconds{{stage="{name}"}} {stage["seconds"]:.6f}' for name, stage in snapshot["stages"].items()]
+        lines += [
+            "# HELP jobstreet_stage_calls Timed calls per sync stage in the last run.",
+            "# TYPE jobstreet_stage_calls gauge",
+        ]
+        lines += [f'jobstreet_stage_calls{{stage="{name}"}} {stage["calls"]}' for name, stage in snapshot["stages"].items()]
+        for name, value in snapshot["counters"].items():
+            lines += [f"# TYPE jobstreet_{name} gauge", f"jobstreet_{name} {value}"]
+        write_atomic(path, "\n".join(lines) + "\n")
+
+def write_atomic(path, text):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+# The run's metrics, shared by every module that reports into them
+metrics = Metrics()
@@ -0,0 +1,481 @@
+import os
+import sqlite3
+import threading
+from copy import copy
+from datetime import date, datetime
+
+# Sheet columns 1-9, in order
+COLUMNS = ("uid", "company", "position", "applied_date", "viewed_date", "closed_date", "applicants", "location", "link")
+# Dates and the applicant count are centered in the sheet
+CENTERED_COLUMNS = {"applied_date", "viewed_date", "closed_date", "applicants"}
+
+# XML namespaces of the sheet parts sheet_layout() reads
+SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+RELATIONSHIP_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+def store_path_for(file_path):
+    return os.path.splitext(file_path)[0] + ".sqlite3"
+
+def cell_value(value):
+    # openpyxl hands back datetimes for cells Excel reformatted; the matching
+    # has always compared str(value), so keep exactly that
+    if isinstance(value, (datetime, date)):
+        return str(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+class ApplicationStore:
+    # The applications table behind one workbook. Rows keep their sheet order by id;
+    # the workbook itself is only rendered by export_workbook().
+    def __init__(self, file_path, path=None):
+        self.file_path = file_path
+        self.path = path or store_path_for(file_path)
+        # Number of account folders writing into this store, and the first of them, which
+        # owns the rows that came without one (sheet imports, stores from a single folder)
+        self.sources = 0
+        self.home = None
+        self.lock = threading.Lock()
+        is_new = not os.path.exists(self.path)
+
+        # Account threads read from it while syncing, hence check_same_thread=False and the lock
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(applications)")]
+        if columns and "mailbox" not in columns:
+            # A store from before rows kept their mailbox: move its rows into the new table
+            self.db.execute("ALTER TABLE applications RENAME TO applications_old")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS applications (
+                id INTEGER PRIMARY KEY,
+                uid TEXT,
+                -- "<user>/<folder>" the UID belongs to; NULL until add_source() assigns the row
+                mailbox TEXT,
+                -- UIDs are only unique within one UIDVALIDITY; NULL until a sync claims the row
+                uidvalidity INTEGER,
+                company TEXT,
+                position TEXT,
+                applied_date TEXT,
+                viewed_date TEXT,
+                closed_date TEXT,
+                applicants INTEGER,
+                location TEXT,
+                link TEXT,
+                UNIQUE (mailbox, uid, uidvalidity)
+            );
+        """)
+        if columns and "mailbox" not in columns:
+            # Older stores fed by several folders prefixed the UID with "<account>/<folder>:",
+            # add_source() moves that prefix into the mailbox column
+            copied = ", ".join(("id",) + COLUMNS + (("uidvalidity",) if "uidvalidity" in columns else ()))
+            self.db.executescript(f"""
+                INSERT INTO applications ({copied}) SELECT {copied} FROM applications_old;
+                DROP TABLE applications_old;
+            """)
+        self.db.executescript("""
+            CREATE INDEX IF NOT EXISTS applications_company_position_date ON applications (company, position, applied_date);
+            CREATE INDEX IF NOT EXISTS applications_position_date ON applications (position, applied_date);
+            CREATE INDEX IF NOT EXISTS applications_position_nocase ON applications (lower(position));
+            -- What the last export wrote for each row, so export_workbook() can tell the user's
+            -- edits and deletions in the sheet from changes the store made since
+            CREATE TABLE IF NOT EXISTS exported (
+                id INTEGER PRIMARY KEY,
+                uid TEXT,
+                company TEXT,
+                position TEXT,
+                applied_date TEXT,
+                viewed_date TEXT,
+                closed_date TEXT,
+                applicants INTEGER,
+                location TEXT,
+                link TEXT
+            );
+        """)
+
+        if is_new and os.path.exists(file_path):
+            self.import_workbook(file_path)
+
+    def import_workbook(self, file_path, sheet_name="Applications"):
+        # First run against an existing sheet: its rows (below the two header rows) seed the table.
+        # openpyxl is imported here and in export_workbook() only, it is slow to load.
+        import openpyxl
+        wb = openpyxl.load_workbook(file_path, read_only=True)
+        rows = []
+        for values in wb[sheet_name].iter_rows(min_row=3, max_col=len(COLUMNS), values_only=True):
+            values = [cell_value(value) for value in values] + [None] * (len(COLUMNS) - len(values))
+            if any(value is not None for value in values):
+                if values[0] is not None:
+                    values[0] = str(values[0])
+                rows.append(values)
+        wb.close()
+
+        with self.lock:
+            self.db.executemany(
+                f"INSERT INTO applications ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows,
+            )
+            # The sheet holds exactly these values, as if they had been exported
+            self.db.execute(f"INSERT OR REPLACE INTO exported SELECT id, {', '.join(COLUMNS)} FROM applications")
+            self.db.commit()
+
+    def add_source(self, mailbox, legacy_source):
+        # Called once per folder feeding this store, in config order. Rows an older store
+        # prefixed with the folder's "<account>/<folder>:" move to its mailbox, and the first
+        # folder takes the rows that have no mailbox and no prefix.
+        prefix = f"{legacy_source}:"
+        with self.lock:
+            self.sources += 1
+            self.db.execute(
+                "UPDATE OR IGNORE applications SET mailbox = ?, uid = substr(uid, ?) WHERE mailbox IS NULL AND substr(uid, 1, ?) = ?",
+                (mailbox, len(prefix) + 1, len(prefix), prefix),
+            )
+            if self.home is None:
+                self.home = mailbox
+                self.db.execute(
+                    "UPDATE OR IGNORE applications SET mailbox = ? WHERE mailbox IS NULL AND instr(uid, ':') = 0", (mailbox,)
+                )
+            self.db.commit()
+
+    def has_uid(self, mailbox, uid, uidvalidity):
+        with self.lock:
+            return self.db.execute(
+                "SELECT 1 FROM applications WHERE mailbox = ? AND uid = ? AND uidvalidity = ?", (mailbox, str(uid), uidvalidity)
+            ).fetchone() is not None
+
+    def claim_uids(self, mailbox, uidvalidity):
+        # Rows imported from the sheet or an older store have no UIDVALIDITY. Their UIDs
+        # are from the one the mailbox had at the last sync, or has now on the first.
+        # A UID the sheet had twice keeps the second row unclaimed.
+        with self.lock:
+            self.db.execute(
+                "UPDATE OR IGNORE applications SET uidvalidity = ? WHERE mailbox = ? AND uidvalidity IS NULL",
+                (uidvalidity, mailbox),
+            )
+
+    def save_submitted(self, mailbox, uid, uidvalidity, company, position, applied_date, location, link):
+        uid = str(uid)
+        with self.lock:
+            if not self.db.execute(
+                "SELECT 1 FROM applications WHERE mailbox = ? AND uid = ? AND uidvalidity = ?", (mailbox, uid, uidvalidity)
+            ).fetchone():
+                # After a UIDVALIDITY change the full resync sees every message again under a new
+                # UID; one already stored from the same mailbox takes over its old row
+                self.db.execute(
+                    "UPDATE applications SET uid = ?, uidvalidity = ? WHERE id = ("
+                    "SELECT id FROM applications WHERE mailbox = ? AND uidvalidity IS NOT ? "
+                    "AND company IS ? AND position IS ? AND applied_date IS ? ORDER BY id LIMIT 1)",
+                    (uid, uidvalidity, mailbox, uidvalidity, company, position, applied_date),
+                )
+            self.db.execute(
+                "INSERT INTO applications (mailbox, uid, uidvalidity, company, position, applied_date, location, link) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (mailbox, uid, uidvalidity) DO UPDATE SET company = excluded.company, position = excluded.position, "
+                "applied_date = excluded.applied_date, location = excluded.location, link = excluded.link",
+                (mailbox, uid, uidvalidity, company, position, applied_date, location, link),
+            )
+
+    def find_row(self, company, position, application_date, fallback=False):
+        # The exact (company, position, applied date) match, then the looser keys
+        # closed_applications falls back to. The earliest row wins, as in the sheet.
+        application_date = str(cell_value(application_date))
+        queries = [
+            ("company = ? AND position = ? AND applied_date = ?", (company, position, application_date)),
+            ("position = ? AND applied_date = ?", (position, application_date)),
+            ("company = ? AND position = ?", (company, position)),
+        ]
+        with self.lock:
+            for where, params in queries if fallback else queries[:1]:
+                row = self.db.execute(f"SELECT id FROM applications WHERE {where} ORDER BY id LIMIT 1", params).fetchone()
+                if row:
+                    return row[0]
+        return ''
+
+    def position_rows(self, position):
+        # (viewed date, closed date) of every row a notification for this position could
+        # update; every find_row key includes the position, compared here without case
+        with self.lock:
+            return self.db.execute(
+                "SELECT viewed_date, closed_date FROM applications WHERE lower(position) = lower(?)", (position,)
+            ).fetchall()
+
+    def earliest_applied_date(self):
+        with self.lock:
+            return self.db.execute("SELECT MIN(applied_date) FROM applications WHERE applied_date IS NOT NULL").fetchone()[0]
+
+    def set_viewed(self, row, viewed_date, overwrite=False):
+        # The first notice wins, however the runs were split; plan_fetches relies on it.
+        # A rebuild overwrites, once per row, with the first cached notice that matches it.
+        with self.lock:
+            self.db.execute(
+                f"UPDATE applications SET viewed_date = ? WHERE id = ?{'' if overwrite else ' AND viewed_date IS NULL'}",
+                (viewed_date, row),
+            )
+
+    def set_closed(self, row, closed_date, applicants, overwrite=False):
+        with self.lock:
+            self.db.execute(
+                f"UPDATE applications SET closed_date = ?, applicants = ? WHERE id = ?{'' if overwrite else ' AND closed_date IS NULL'}",
+                (closed_date, applicants, row),
+            )
+
+    def iter_rows(self, batch_size=1000):
+        # (id, values) in sheet order, a batch at a time
+        cursor = self.db.execute(f"SELECT id, {', '.join(COLUMNS)} FROM applications ORDER BY id")
+        while True:
+            with self.lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0], row[1:]
+
+    def sheet_keys(self):
+        # Row ids by UID in sheet order, and the values each row had at the last export
+        with self.lock:
+            ids = {}
+            for row_id, uid in self.db.execute("SELECT id, uid FROM applications ORDER BY id"):
+                ids.setdefault(uid, []).append(row_id)
+            exported = {row[0]: row[1:] for row in self.db.execute(f"SELECT id, {', '.join(COLUMNS)} FROM exported")}
+        return ids, exported
+
+    def apply_sheet_edits(self, edits):
+        # (column, value, id) of the cells the user changed in the sheet
+        with self.lock:
+            for column, value, row_id in edits:
+                self.db.execute(f"UPDATE applications SET {column} = ? WHERE id = ?", (value, row_id))
+
+    def mark_exported(self):
+        with self.lock:
+            self.db.execute("DELETE FROM exported")
+            self.db.execute(f"INSERT INTO exported SELECT id, {', '.join(COLUMNS)} FROM applications")
+            self.db.commit()
+
+    def count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM applications").fetchone()[0]
+
+    def summary(self):
+        # Row, viewed, closed and still open counts, for the stats command
+        with self.lock:
+            rows, viewed, closed, still_open = self.db.execute("""
+                SELECT COUNT(*), COUNT(viewed_date), COUNT(closed_date), COALESCE(SUM(closed_date IS NULL), 0)
+                FROM applications
+            """).fetchone()
+        return {"rows": rows, "viewed": viewed, "closed": closed, "open": still_open}
+
+    def save(self):
+        with self.lock:
+            self.db.commit()
+
+    def close(self):
+        self.save()
+        self.db.close()
+
+def cell_style(cell):
+    # A sheet cell's style, copied so it outlives the workbook it was read from
+    if not getattr(cell, "has_style", False):
+        return None
+    return {
+        "font": copy(cell.font),
+        "fill": copy(cell.fill),
+        "border": copy(cell.border),
+        "alignment": copy(cell.alignment),
+        "number_format": cell.number_format,
+    }
+
+def set_style(cell, style):
+    for name, value in (style or {}).items():
+        setattr(cell, name, value)
+
+def sheet_value(value):
+    # A cell as the store keeps it: cell_value() without the midnight Excel adds to a
+    # date it converted or the fraction it adds to a whole number
+    value = cell_value(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.endswith(" 00:00:00"):
+        return value[:-len(" 00:00:00")]
+    return None if value == "" else value
+
+def same_value(value, stored):
+    return (None if value is None else str(value)) == (None if stored is None else str(stored))
+
+def header_rows(file_path, ws, sheet_name="Applications"):
+    # Rows 1-2 of the existing sheet, values and cell styles, read without loading the rest of it
+    if not os.path.exists(file_path):
+        return [["Applications"], [name.replace("_", " ").title() for name in COLUMNS]]
+
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    wb = openpyxl.load_workbook(file_path, read_only=True)
+    rows = []
+    for cells in wb[sheet_name].iter_rows(min_row=1, max_row=2):
+        row = []
+        for source in cells:
+            cell = WriteOnlyCell(ws, value=getattr(source, "value", None))
+            set_style(cell, cell_style(source))
+            row.append(cell)
+        rows.append(row)
+    wb.close()
+    return rows
+
+def sheet_layout(file_path, sheet_name="Applications"):
+    # Column widths, frozen panes, merged ranges and the autofilter of one sheet. openpyxl's
+    # read-only mode skips them and a full load keeps every cell, so they are read from the
+    # sheet XML, dropping each row as soon as it is parsed.
+    import zipfile
+    from xml.etree import ElementTree
+    with zipfile.ZipFile(file_path) as archive:
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        relations = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        sheet_id = next(sheet.get(f"{RELATIONSHIP_NS}id") for sheet in workbook.iter(f"{SHEET_NS}sheet") if sheet.get("name") == sheet_name)
+        target = next(relation.get("Target") for relation in relations if relation.get("Id") == sheet_id)
+        sheet_path = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+
+        columns, freeze_panes, merged, auto_filter = [], None, [], None
+        with archive.open(sheet_path) as f:
+            for event, element in ElementTree.iterparse(f, events=("start", "end")):
+                if event == "end":
+                    if element.tag == f"{SHEET_NS}row":
+                        element.clear()
+                elif element.tag == f"{SHEET_NS}col":
+                    columns.append(dict(element.attrib))
+                elif element.tag == f"{SHEET_NS}pane" and element.get("state") == "frozen":
+                    freeze_panes = element.get("topLeftCell")
+                elif element.tag == f"{SHEET_NS}mergeCell":
+                    merged.append(element.get("ref"))
+                elif element.tag == f"{SHEET_NS}autoFilter":
+                    auto_filter = element.get("ref")
+    return columns, freeze_panes, merged, auto_filter
+
+def merge_sheet(store, ws):
+    # The user may have edited the sheet since the last export. Its rows below the headers are
+    # matched to the store rows they were exported from by UID, and for a UID several mailboxes
+    # share, by company, position and applied date. Cells in the store columns that changed since
+    # the last export go into the store. Returns the cells past the store columns by row id, and
+    # the rows the store does not know by the id of the row they follow (0 for the top), so the
+    # export can put both back.
+    ids, exported = store.sheet_keys()
+    matched = set()
+    extras, kept, edits = {}, {}, []
+    after = 0
+    for cells in ws.iter_rows(min_row=3):
+        cells = list(cells)
+        while cells and getattr(cells[-1], "value", None) is None and not getattr(cells[-1], "has_style", False):
+            cells.pop()
+        if not cells:
+            continue
+        values = [sheet_value(getattr(cell, "value", None)) for cell in cells[:len(COLUMNS)]]
+        values += [None] * (len(COLUMNS) - len(values))
+
+        uid = None if values[0] is None else str(values[0])
+        candidates = [row_id for row_id in ids.get(uid, ()) if row_id not in matched]
+        if not candidates:
+            kept.setdefault(after, []).append([(getattr(cell, "value", None), cell_style(cell)) for cell in cells])
+            continue
+        row_id = next(
+            (row_id for row_id in candidates if row_id in exported and all(map(same_value, values[1:4], exported[row_id][1:4]))),
+            candidates[0],
+        )
+        matched.add(row_id)
+        after = row_id
+        if len(cells) > len(COLUMNS):
+            extras[row_id] = [(getattr(cell, "value", None), cell_style(cell)) for cell in cells[len(COLUMNS):]]
+        if row_id in exported:
+            edits += [
+                (COLUMNS[column], values[column], row_id)
+                for column in range(1, len(COLUMNS))
+                if not same_value(values[column], exported[row_id][column])
+            ]
+
+    store.apply_sheet_edits(edits)
+    if edits:
+        print(f"Kept {len(edits)} cell(s) edited in '{store.file_path}' since the last export")
+    if kept:
+        print(f"Warning: {sum(map(len, kept.values()))} row(s) in '{store.file_path}' are not in the store, they are kept as they are")
+    return extras, kept
+
+def sheet_rows(store, extras, kept):
+    # Every row below the headers as (value, style) pairs: the store rows followed by the
+    # cells the user added past them, with the rows the store does not know where they were
+    from openpyxl.styles import Alignment
+    centered = {"alignment": Alignment(horizontal='center')}
+    styles = [centered if name in CENTERED_COLUMNS else None for name in COLUMNS]
+    yield from kept.get(0, ())
+    for row_id, values in store.iter_rows():
+        yield list(zip(values, styles)) + extras.get(row_id, [])
+        yield from kept.get(row_id, ())
+
+def export_workbook(store, file_path=None, sheet_name="Applications"):
+    # The Applications sheet is rewritten from the store: the header rows stay as they are
+    # and everything below comes from the store, merged with what the user did to the sheet
+    # since the last export (see merge_sheet). A workbook holding only that sheet is
+    # read and streamed in write-only mode, so its cells are never all in memory at once. Other
+    # sheets cannot be carried over by a write-only workbook, so a workbook that has them
+    # is loaded in full and only the Applications rows are replaced.
+    import openpyxl
+    file_path = file_path or store.file_path
+    other_sheets = []
+    if os.path.exists(file_path):
+        wb = openpyxl.load_workbook(file_path, read_only=True)
+        other_sheets = [name for name in wb.sheetnames if name != sheet_name]
+        wb.close()
+
+    if other_sheets:
+        wb = update_workbook(store, file_path, sheet_name)
+    else:
+        wb = stream_workbook(store, file_path, sheet_name)
+
+    # Write next to the workbook and swap it in, so an interrupted save never leaves a truncated file
+    temp_path = f"{file_path}.tmp"
+    wb.save(temp_path)
+    os.replace(temp_path, file_path)
+    store.mark_exported()
+
+def stream_workbook(store, file_path, sheet_name="Applications"):
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    extras, kept = {}, {}
+    if os.path.exists(file_path):
+        columns, ws.freeze_panes, merged, ws.auto_filter.ref = sheet_layout(file_path, sheet_name)
+        for column in columns:
+            first, last = int(column["min"]), int(column["max"])
+            dimension = ws.column_dimensions[get_column_letter(first)]
+            dimension.min, dimension.max = first, last
+            if "width" in column:
+                dimension.width = float(column["width"])
+            dimension.hidden = column.get("hidden") in ("1", "true")
+        for ref in merged:
+            ws.merged_cells.add(ref)
+        existing = openpyxl.load_workbook(file_path, read_only=True)
+        extras, kept = merge_sheet(store, existing[sheet_name])
+        existing.close()
+    for row in header_rows(file_path, ws, sheet_name):
+        ws.append(row)
+
+    for row in sheet_rows(store, extras, kept):
+        cells = []
+        for value, style in row:
+            if style:
+                value = WriteOnlyCell(ws, value=value)
+                set_style(value, style)
+            cells.append(value)
+        ws.append(cells)
+    return wb
+
+def update_workbook(store, file_path, sheet_name="Applications"):
+    import openpyxl
+    wb = openpyxl.load_workbook(file_path)
+    ws = wb[sheet_name]
+    extras, kept = merge_sheet(store, ws)
+    if ws.max_row > 2:
+        ws.delete_rows(3, ws.max_row - 2)
+
+    for row, cells in enumerate(sheet_rows(store, extras, kept), 3):
+        ws.append([value for value, style in cells])
+        for column, (value, style) in enumerate(cells, 1):
+            if style:
+                set_style(ws.cell(row, column), style)
+    return wb
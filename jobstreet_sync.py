@@ -0,0 +1,771 @@
+import imaplib
+from itertools import chain
+import email
+from email.header import decode_header
+import re
+import sys
+import queue
+import threading
+import concurrent.futures
+from collections import deque
+import asyncio
+import functools
+import itertools
+import select
+import time
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+from jobstreet_extractor import SUBJECTS, EXTRACTORS, subject_kind, subject_fields, timed_extract
+from jobstreet_metrics import metrics
+
+# The IMAP side of a sync: searching, fetching, parsing and applying the three
+# notification passes. Only the sync and export commands import it.
+
+def sync_accounts(accounts, stores, state, cache, executor, options, uid_max=0, max_connections=4):
+    # Every running account holds one session, plus options.connections more while a
+    # pass is fetched concurrently, so size the account pool to stay under max_connections
+    if options.connections > 1:
+        options = options._replace(connections=max(1, min(options.connections, max_connections - 1)))
+    per_account = 1 + (options.connections if options.connections > 1 else 0)
+    workers = max(1, min(len(accounts), max_connections // per_account))
+    
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(sync_account, account, stores[account.file_path], state, cache, executor, options, uid_max)
+            for account in accounts
+        ]
+        account_results = [future.result() for future in futures]
+        
+    print("")
+    results = []
+    for account, (mailbox_results, elapsed) in zip(accounts, account_results):
+        messages = sum(len(records) for mailbox, uidvalidity, records in mailbox_results for records in records.values())
+        print(f"Account {account.name}: {messages} messages from {len(account.folders)} folder(s) in {elapsed:.1f}s")
+        results += [(account, mailbox, uidvalidity, records) for mailbox, uidvalidity, records in mailbox_results]
+    return results
+
+def sync_account(account, store, state, cache, executor, options, uid_max=0):
+    started = time.perf_counter()
+    mailbox_results = []
+    
+    imap_server = connect_mailbox(account.username, account.password, account.host, account.port, account.use_ssl, account.folders[0])
+    try:
+        for index, folder in enumerate(account.folders):
+            if index:
+                select_folder(imap_server, folder)
+            
+            connect = functools.partial(connect_mailbox, account.username, account.password, account.host, account.port, account.use_ssl, folder)
+            mailbox = f"{account.username}/{folder}"
+            uidvalidity = mailbox_uidvalidity(imap_server, folder)
+            store.claim_uids(mailbox, state["mailboxes"].get(mailbox, {}).get("uidvalidity", uidvalidity))
+            mailbox_state = mailbox_sync_state(state, mailbox, uidvalidity, uid_max)
+            
+            records = sync_mailbox(store, imap_server, connect, mailbox, mailbox_state, account.criteria, cache, executor, options)
+            mailbox_results.append((mailbox, uidvalidity, records))
+    finally:
+        imap_server.logout()
+        
+    return mailbox_results, time.perf_counter() - started
+
+def sync_mailbox(store, imap_server, connect, mailbox, mailbox_state, criteria, cache, executor, options):
+    uid_max = min(mailbox_state[name] for name in options.passes)
+    uids, notices = search_applications(imap_server, uid_max, criteria, options.chunk_size, options.passes)
+    
+    records = {}
+    for name in options.passes:
+        pass_uids = [uid for uid in uids[name] if uid > mailbox_state[name]]
+        fetch_uids = pass_uids
+        if name == "submitted":
+            # UIDs already stored were written by an earlier run
+            fetch_uids = [uid for uid in pass_uids if not store.has_uid(mailbox, uid, mailbox_state["uidvalidity"])]
+        elif options.plan_fetches and "submitted" in records:
+            # Without this run's submissions the planner could skip mail for rows not stored yet
+            fetch_uids = plan_fetches(store, name, pass_uids, notices, records["submitted"])
+        
+        fetch = lambda missing: fetch_pass_emails(imap_server, connect, missing, options)
+        if cache is not None:
+            messages = cache.fetch(mailbox, mailbox_state["uidvalidity"], name, fetch_uids, fetch)
+        else:
+            messages = fetch(fetch_uids)
+        records[name] = list(parse_messages(messages, EXTRACTORS[name], executor, 2 * options.chunk_size))
+        metrics.count(f"{name}_messages", len(records[name]))
+        
+        if pass_uids:
+            mailbox_state[name] = max(pass_uids)
+            
+    return records
+
+def plan_fetches(store, name, uids, notices, submitted):
+    # Viewed and closed bodies are only fetched when they can still change a row. The subject
+    # already names the job, so a notification is skipped when every stored row for that
+    # position has its viewed (column 5) or closed (column 6) date, when no row or new
+    # submission has the position at all, or when it arrived before the earliest application.
+    # Subjects that cannot be read with certainty are always fetched. A store fed by several
+    # folders can get its rows from submissions this folder has not seen yet, so it is left alone.
+    if store.sources > 1:
+        return uids
+    
+    submitted_positions = {record.position.lower() for record in submitted if record.position}
+    earliest = earliest_application(store, submitted)
+    column = 0 if name == "viewed" else 1
+    
+    fetch_uids = []
+    for uid in uids:
+        subject, internal_date = notices.get(uid, (None, None))
+        fields = subject_fields(name, subject) if subject else None
+        if fields is None:
+            fetch_uids.append(uid)
+            continue
+        
+        company, position = fields
+        # Two days of slack for the time zones between INTERNALDATE and the Date header
+        if earliest and internal_date and internal_date.date() < earliest - timedelta(days=2):
+            continue
+        # A submission earlier in this run is not stored yet, so its row cannot be checked
+        if position.lower() in submitted_positions:
+            fetch_uids.append(uid)
+            continue
+        rows = store.position_rows(position)
+        if rows and not all(row[column] for row in rows):
+            fetch_uids.append(uid)
+            
+    metrics.count(f"{name}_skipped", len(uids) - len(fetch_uids))
+    return fetch_uids
+
+def earliest_application(store, submitted):
+    dates = [store.earliest_applied_date()] + [record.email_date for record in submitted]
+    parsed = []
+    for value in dates:
+        try:
+            parsed.append(date.fromisoformat(str(value)[:10]))
+        except ValueError:
+            # A date the planner cannot read could be anything, so no cut-off at all
+            if value:
+                return None
+    return min(parsed, default=None)
+
+def watch_mailbox(account, folder, store, marks, cache, executor, options, results):
+    connect = functools.partial(connect_mailbox, account.username, account.password, account.host, account.port, account.use_ssl, folder)
+    mailbox = f"{account.username}/{folder}"
+    source = f"{account.name}/{folder}"
+    state = {"mailboxes": {mailbox: marks}}
+    
+    while True:
+        try:
+            imap_server = connect()
+            try:
+                mailbox_state = mailbox_sync_state(state, mailbox, mailbox_uidvalidity(imap_server, folder))
+                while True:
+                    # The sync covers everything announced so far, the SELECT's EXISTS included
+                    imap_server.response("EXISTS")
+                    records = sync_mailbox(store, imap_server, connect, mailbox, mailbox_state, account.criteria, cache, executor, options)
+                    if any(records.values()):
+                        results.put((account, mailbox, dict(mailbox_state), records))
+                    # Mail that arrived during the sync was announced in the reply to one of its
+                    # commands, where imaplib keeps it, and IDLE would not announce it again. Otherwise
+                    # wait in IDLE; when it times out the mailbox is searched anyway, in case a
+                    # notification was lost.
+                    if imap_server.response("EXISTS")[1] == [None]:
+                        idle(imap_server)
+            finally:
+                try:
+                    imap_server.logout()
+                except (imaplib.IMAP4.error, OSError):
+                    pass
+        except (imaplib.IMAP4.abort, OSError) as e:
+            print(f"Lost the connection to {source} ({e}), reconnecting in 30s")
+            time.sleep(30)
+        except BaseException as e:
+            results.put(e)
+            return
+
+def reparse_from_cache(account, cache, state, executor, chunk_size=200, passes=tuple(SUBJECTS)):
+    results = []
+    for folder in account.folders:
+        mailbox = f"{account.username}/{folder}"
+        mailbox_state = state["mailboxes"].get(mailbox)
+        if cache is None or mailbox_state is None:
+            raise Exception(f"No cached messages for {mailbox}, run a normal sync first")
+        
+        records = {}
+        for name in passes:
+            messages = cache.messages(mailbox, mailbox_state["uidvalidity"], name)
+            records[name] = list(parse_messages(messages, EXTRACTORS[name], executor, 2 * chunk_size))
+            metrics.count(f"{name}_messages", len(records[name]))
+        results.append((account, mailbox, mailbox_state["uidvalidity"], records))
+    return results
+
+def apply_results(stores, results, rewrite=False, verbose=0):
+    # Every submitted row goes in before any viewed/closed update looks for it
+    for name, apply_records in PASSES.items():
+        for account, mailbox, uidvalidity, records in results:
+            if name not in records:
+                # A sync limited to some passes with --only
+                continue
+            store = stores[account.file_path]
+            with metrics.stage("match"):
+                if name == "submitted":
+                    # On a rebuild, rows already stored are rewritten with the current parser output
+                    submitted_applications(store, records[name], mailbox, uidvalidity, rewrite, verbose)
+                else:
+                    # On a rebuild, a cached notice replaces the date on the row it matches; rows
+                    # no cached notice matches keep theirs (sheet imports, evicted or skipped mail)
+                    apply_records(store, records[name], verbose, rewrite)
+
+class FetchOptions(NamedTuple):
+    chunk_size: int = 200
+    fetch_mode: str = "text"
+    connections: int = 1
+    plan_fetches: bool = True
+    # Passes to run, in order; sync --only narrows them
+    passes: tuple = tuple(SUBJECTS)
+
+def mailbox_sync_state(state, mailbox, uidvalidity, uid_max=0):
+    # Last processed UID per pass. UIDs are only comparable within one UIDVALIDITY,
+    # so a new UIDVALIDITY throws the high-water marks away and resyncs from the start.
+    mailbox_state = state["mailboxes"].get(mailbox)
+    
+    if mailbox_state is None:
+        mailbox_state = {name: uid_max for name in SUBJECTS}
+    elif mailbox_state.get("uidvalidity") != uidvalidity:
+        print(f"\nUIDVALIDITY of {mailbox} changed, running a full resync")
+        mailbox_state = {name: 0 for name in SUBJECTS}
+        
+    mailbox_state["uidvalidity"] = uidvalidity
+    state["mailboxes"][mailbox] = mailbox_state
+    return mailbox_state
+
+def search_string(uid_max, criteria, subjects=()):
+    c = list(map(lambda t: (t[0], '"'+str(t[1])+'"'), criteria.items())) + [('UID', '%d:*' % (uid_max+1))]
+    subject_keys = ['SUBJECT "%s"' % subject for subject in subjects]
+    if subject_keys:
+        # IMAP OR takes two keys, so nest it: OR OR a b c
+        c.append(('OR ' * (len(subject_keys) - 1) + ' '.join(subject_keys),))
+    return '(%s)' % ' '.join(chain(*c))
+
+def decode_subject(raw_subject):
+    parts = []
+    for part, encoding in decode_header(raw_subject or ""):
+        if isinstance(part, bytes):
+            part = part.decode(encoding or "utf-8", errors="replace")
+        parts.append(part)
+    return re.sub(r"\s+", " ", "".join(parts)).strip()
+
+def connect_mailbox(username, password, host="imap.mail.yahoo.com", port=993, use_ssl=True, folder="INBOX"):
+    with metrics.stage("login"):
+        imap_server = imaplib.IMAP4_SSL(host, port) if use_ssl else imaplib.IMAP4(host, port)
+        imap_server.login(username, password)
+        select_folder(imap_server, folder)
+    return imap_server
+
+def select_folder(imap_server, folder):
+    result, data = imap_server.select(folder)
+    if result != "OK":
+        raise imaplib.IMAP4.error(f"Unable to select folder '{folder}': {data}")
+
+IDLE_TAGS = itertools.count(1)
+# RFC 2177: servers may drop an IDLE after 30 minutes, so clients re-issue it before that
+IDLE_TIMEOUT = 29 * 60
+
+def read_idle_line(imap_server, buffer, timeout):
+    # A line straight off the socket, or None once timeout passes. imaplib's own file object
+    # is no use here: a read timeout leaves it unusable, and select() cannot see its buffer.
+    deadline = time.monotonic() + timeout
+    while b"\n" not in buffer:
+        remaining = deadline - time.monotonic()
+        pending = imap_server.sock.pending() if hasattr(imap_server.sock, "pending") else 0
+        if not pending and (remaining <= 0 or not select.select([imap_server.sock], [], [], remaining)[0]):
+            return None
+        data = imap_server.sock.recv(4096)
+        if not data:
+            raise imaplib.IMAP4.abort("connection closed during IDLE")
+        buffer += data
+    end = buffer.index(b"\n") + 1
+    line = bytes(buffer[:end])
+    del buffer[:end]
+    return line
+
+def idle(imap_server, timeout=IDLE_TIMEOUT, settle=2.0):
+    # imaplib has no IDLE before Python 3.14, so this speaks it directly: send IDLE, wait for
+    # "* n EXISTS", then DONE and the tagged reply. Mail tends to arrive in bursts, so after
+    # the first EXISTS it keeps listening for settle seconds. Returns whether new mail came in.
+    tag = f"W{next(IDLE_TAGS)}".encode()
+    buffer = bytearray()
+    imap_server.send(tag + b" IDLE\r\n")
+    line = read_idle_line(imap_server, buffer, 30)
+    if line is None or not line.startswith(b"+"):
+        raise imaplib.IMAP4.error(f"IDLE not accepted: {line!r}")
+    
+    new_mail = False
+    deadline = time.monotonic() + timeout
+    while True:
+        line = read_idle_line(imap_server, buffer, deadline - time.monotonic())
+        if line is None:
+            break
+        if re.match(rb"\* \d+ EXISTS", line):
+            if not new_mail:
+                deadline = min(deadline, time.monotonic() + settle)
+            new_mail = True
+    
+    imap_server.send(b"DONE\r\n")
+    while True:
+        line = read_idle_line(imap_server, buffer, 30)
+        if line is None:
+            raise imaplib.IMAP4.abort("no reply to DONE")
+        if re.match(rb"\* \d+ EXISTS", line):
+            new_mail = True
+        if line.startswith(tag + b" "):
+            if not line.startswith(tag + b" OK"):
+                raise imaplib.IMAP4.error(f"IDLE failed: {line!r}")
+            return new_mail
+
+def uid_set(uids):
+    # Collapse UIDs into an IMAP sequence set, e.g. 1001:1200,1305
+    ranges = []
+    for uid in sorted(uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(first) if first == last else f"{first}:{last}" for first, last in ranges)
+
+def parse_fetch_response(msg_data):
+    # imaplib splits each FETCH response around its literals: (prefix, literal) tuples
+    # followed by the closing bytes, e.g. [(b'1 (UID 1001 RFC822 {1234}', b'...'), b')']
+    messages = []
+    for response_part in msg_data:
+        if isinstance(response_part, tuple):
+            meta, literal = response_part
+        else:
+            meta, literal = response_part, None
+        if not meta:
+            continue
+        
+        if re.match(rb"\d+ \(", meta):
+            messages.append([meta, []])
+        elif messages:
+            messages[-1][0] += meta
+        else:
+            continue
+        
+        if literal is not None:
+            messages[-1][1].append(literal)
+            
+    for meta, literals in messages:
+        match = re.search(rb"UID (\d+)", meta)
+        if match:
+            yield int(match.group(1)), meta, literals
+
+def uid_fetch(imap_server, uids, message_parts):
+    with metrics.stage("fetch"):
+        result, msg_data = imap_server.uid('fetch', uid_set(uids), message_parts)
+    if result != "OK":
+        raise imaplib.IMAP4.error(f"UID FETCH failed: {msg_data}")
+    
+    metrics.count("fetched_bytes", sum(
+        len(part) for response_part in msg_data
+        for part in (response_part if isinstance(response_part, tuple) else (response_part,))
+        if isinstance(part, bytes)
+    ))
+    return msg_data
+
+def fetch_messages(imap_server, uids, chunk_size=200, message_parts="(RFC822)"):
+    uids = sorted({int(uid) for uid in uids})
+    
+    for i in range(0, len(uids), chunk_size):
+        chunk = uids[i:i + chunk_size]
+        msg_data = uid_fetch(imap_server, chunk, message_parts)
+        
+        fetched = {}
+        for num_int, meta, literals in parse_fetch_response(msg_data):
+            if literals:
+                fetched[num_int] = literals[0]
+                
+        for num_int in chunk:
+            if num_int in fetched:
+                yield num_int, fetched[num_int]
+
+def parse_imap_list(text):
+    tokens = re.findall(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()]+', text)
+    stack = [[]]
+    for token in tokens:
+        if token == b"(":
+            stack.append([])
+        elif token == b")":
+            if len(stack) == 1:
+                break
+            item = stack.pop()
+            stack[-1].append(item)
+        elif token.startswith(b'"'):
+            stack[-1].append(re.sub(rb'\\(.)', rb"\1", token[1:-1]).decode(errors="replace"))
+        elif token.upper() == b"NIL":
+            stack[-1].append(None)
+        else:
+            stack[-1].append(token.decode(errors="replace"))
+    return stack[0]
+
+def find_text_part(structure, section=""):
+    # Mirrors the msg.walk() loop in the passes: the last text/plain part that is not an attachment
+    if isinstance(structure[0], list):
+        found = None
+        for index, child in enumerate(structure, 1):
+            if not isinstance(child, list):
+                break
+            part = find_text_part(child, f"{section}.{index}" if section else str(index))
+            if part:
+                found = part
+        return found
+    
+    content_type = f"{structure[0]}/{structure[1]}".lower()
+    params = structure[2] if isinstance(structure[2], list) else []
+    charset = {str(key).lower(): value for key, value in zip(params[::2], params[1::2])}.get("charset", "utf-8")
+    part = (section or "1", structure[5] or "7bit", charset)
+    
+    if not section:
+        return part
+    disposition = structure[9] if len(structure) > 9 else None
+    if content_type == "text/plain" and not (isinstance(disposition, list) and "attachment" in str(disposition[0]).lower()):
+        return part
+    return None
+
+def fetch_text_parts(imap_server, uids, chunk_size=200):
+    # BODYSTRUCTURE plus the headers the passes read, then only the text/plain section.
+    # BODY.PEEK leaves the \Seen flag alone.
+    uids = sorted({int(uid) for uid in uids})
+    
+    for i in range(0, len(uids), chunk_size):
+        chunk = uids[i:i + chunk_size]
+        msg_data = uid_fetch(imap_server, chunk, '(BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT DATE)])')
+        
+        headers = {}
+        sections = {}
+        full_fetch = []
+        for num_int, meta, literals in parse_fetch_response(msg_data):
+            structure_at = meta.upper().find(b"BODYSTRUCTURE (")
+            # A literal inside the structure means the header literal is not the first one; fetch it whole
+            if structure_at < 0 or not literals or re.search(rb"\{\d+\}", meta[structure_at:meta.upper().find(b"BODY[", structure_at)]):
+                full_fetch.append(num_int)
+                continue
+            
+            part = find_text_part(parse_imap_list(meta[structure_at + len(b"BODYSTRUCTURE "):])[0])
+            headers[num_int] = (literals[0], part)
+            if part:
+                sections.setdefault(part[0], []).append(num_int)
+        
+        bodies = {}
+        for section, section_uids in sections.items():
+            bodies.update(fetch_messages(imap_server, section_uids, chunk_size, f"(BODY.PEEK[{section}])"))
+        bodies.update(fetch_messages(imap_server, full_fetch, chunk_size))
+            
+        for num_int in chunk:
+            if num_int in headers:
+                raw_header, part = headers[num_int]
+                section, encoding, charset = part or ("", "7bit", "utf-8")
+                yield num_int, (
+                    raw_header.rstrip(b"\r\n") + b"\r\n"
+                    + f'Content-Type: text/plain; charset="{charset}"\r\n'.encode()
+                    + f"Content-Transfer-Encoding: {encoding}\r\n\r\n".encode()
+                    + bodies.get(num_int, b"")
+                )
+            elif num_int in bodies:
+                yield num_int, bodies[num_int]
+
+def fetch_emails(imap_server, uids, chunk_size=200, fetch_mode="text"):
+    if fetch_mode == "text":
+        return fetch_text_parts(imap_server, uids, chunk_size)
+    return fetch_messages(imap_server, uids, chunk_size)
+
+def mailbox_uidvalidity(imap_server, mailbox="INBOX"):
+    result, data = imap_server.response("UIDVALIDITY")
+    if not data or data[0] is None:
+        result, data = imap_server.status(mailbox, "(UIDVALIDITY)")
+        data = re.findall(rb"UIDVALIDITY (\d+)", data[0])
+    return int(data[0])
+
+def fetch_emails_concurrent(connect, uids, connections=4, chunk_size=200, fetch_mode="text"):
+    # An asyncio loop on a background thread drives a small pool of logged-in sessions,
+    # each pulling the next UID chunk off a shared queue. imaplib is blocking, so every
+    # command runs through asyncio.to_thread. Chunks are handed back as soon as they and
+    # every chunk before them are in, which keeps rows in UID order. A worker takes one of
+    # 2 * connections permits before each chunk and the consumer hands it back once the chunk
+    # is passed on, so a consumer that falls behind pauses the fetch instead of piling it up.
+    uids = sorted({int(uid) for uid in uids})
+    chunks = [uids[i:i + chunk_size] for i in range(0, len(uids), chunk_size)]
+    if not chunks:
+        return
+    
+    results = queue.Queue()
+    permits = threading.Semaphore(2 * connections)
+    stop = threading.Event()
+    
+    async def worker(chunk_queue):
+        imap_server = await asyncio.to_thread(connect)
+        try:
+            while not chunk_queue.empty():
+                await asyncio.to_thread(permits.acquire)
+                if stop.is_set() or chunk_queue.empty():
+                    return
+                index, chunk = chunk_queue.get_nowait()
+                messages = await asyncio.to_thread(lambda: list(fetch_emails(imap_server, chunk, chunk_size, fetch_mode)))
+                results.put((index, messages))
+        finally:
+            await asyncio.to_thread(imap_server.logout)
+    
+    async def fetch_all():
+        chunk_queue = asyncio.Queue()
+        for item in enumerate(chunks):
+            chunk_queue.put_nowait(item)
+        try:
+            await asyncio.gather(*(worker(chunk_queue) for _ in range(min(connections, len(chunks)))))
+        except BaseException as e:
+            # Handed on before asyncio.run() waits for the other workers, which may be
+            # waiting for a permit only the consumer gives back
+            results.put(e)
+            
+    def run_loop():
+        try:
+            asyncio.run(fetch_all())
+        except BaseException as e:
+            results.put(e)
+            
+    threading.Thread(target=run_loop, daemon=True).start()
+    
+    ready = {}
+    next_index = 0
+    try:
+        while next_index < len(chunks):
+            item = results.get()
+            if isinstance(item, BaseException):
+                raise item
+            
+            index, messages = item
+            ready[index] = messages
+            while next_index in ready:
+                yield from ready.pop(next_index)
+                next_index += 1
+                permits.release()
+    finally:
+        # On an error, or a consumer that stopped early, let waiting workers see the stop and log out
+        stop.set()
+        for _ in range(connections):
+            permits.release()
+
+def fetch_pass_emails(imap_server, connect, uids, options):
+    # Extra connections only pay off once there is more than one chunk to spread over them
+    if options.connections > 1 and len(uids) > options.chunk_size:
+        return fetch_emails_concurrent(connect, uids, options.connections, options.chunk_size, options.fetch_mode)
+    return fetch_emails(imap_server, uids, options.chunk_size, options.fetch_mode)
+
+def search_applications(imap_server, uid_max, criteria, chunk_size=200, passes=tuple(SUBJECTS)):
+    # One search for all the notification types being synced, then sort the UIDs by subject.
+    # The subject and INTERNALDATE of each are kept for plan_fetches.
+    with metrics.stage("search"):
+        result, data = imap_server.uid('search', None, search_string(uid_max, criteria, [SUBJECTS[name] for name in passes]))
+    
+    uids = {name: [] for name in SUBJECTS}
+    notices = {}
+    if not data[0]:
+        return uids, notices
+    
+    found = sorted({int(uid) for uid in data[0].split()})
+    for i in range(0, len(found), chunk_size):
+        msg_data = uid_fetch(imap_server, found[i:i + chunk_size], '(INTERNALDATE BODY.PEEK[HEADER.FIELDS (SUBJECT)])')
+        for num_int, meta, literals in parse_fetch_response(msg_data):
+            if not literals:
+                continue
+            subject = decode_subject(email.message_from_bytes(literals[0])["Subject"])
+            kind = subject_kind(subject)
+            if kind in passes:
+                uids[kind].append(num_int)
+                notices[num_int] = (subject, internal_date(meta))
+                
+    for name in uids:
+        uids[name].sort()
+    return uids, notices
+
+def internal_date(meta):
+    match = re.search(rb'INTERNALDATE "([^"]+)"', meta)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1).decode().strip(), "%d-%b-%Y %H:%M:%S %z")
+    except ValueError:
+        return None
+
+def parse_messages(messages, parse_email, executor=None, queue_size=400):
+    # Fetch stage: a thread drains the IMAP generator into a bounded queue, so the next
+    # chunk downloads while earlier ones are parsed. Parse stage: the process pool.
+    # The caller is the single writer and gets the records back in UID order.
+    def timed(result):
+        record, mime_seconds, extract_seconds = result
+        metrics.add_time("mime", mime_seconds)
+        metrics.add_time("extract", extract_seconds)
+        return record
+    
+    if executor is None:
+        for num_int, raw_email in messages:
+            yield timed(timed_extract(parse_email, num_int, raw_email))
+        return
+    
+    raw_queue = queue.Queue(maxsize=queue_size)
+    
+    def fetch_stage():
+        try:
+            for message in messages:
+                raw_queue.put(message)
+        except BaseException as e:
+            raw_queue.put(e)
+            return
+        raw_queue.put(None)
+        
+    threading.Thread(target=fetch_stage, daemon=True).start()
+    
+    pending = deque()
+    while True:
+        message = raw_queue.get()
+        if message is None:
+            break
+        if isinstance(message, BaseException):
+            raise message
+        
+        pending.append(executor.submit(timed_extract, parse_email, *message))
+        while pending and (pending[0].done() or len(pending) >= queue_size):
+            yield timed(pending.popleft().result())
+            
+    while pending:
+        yield timed(pending.popleft().result())
+
+def submitted_applications(store, records, mailbox=None, uidvalidity=None, rewrite=False, verbose=0):
+
+    print(f"\nAdding submitted applications")
+    
+    try:
+        for record in records:
+            num_int = record.uid
+            if not rewrite and store.has_uid(mailbox, num_int, uidvalidity):
+                continue
+                
+            if verbose:
+                print("--------------------------------------------------------------------------------------")     
+                print(f"UID: {num_int} | Subject: {record.subject}")
+            
+            if record.subject == 'Your application was successfully submitted':
+                email_date = record.email_date
+                
+                if verbose:
+                    print(f"Date: {email_date}")
+                    print(f"Position: {record.position}")
+                    print(f"Company: {record.company}")
+                    print(f"Location: {record.location}")
+                
+                store.save_submitted(mailbox, num_int, uidvalidity, record.company, record.position, email_date, record.location, record.job_link)
+                metrics.count("submitted_rows")
+            
+    except PermissionError as e:
+        print(f"Error: Unable to access '{store.path}' due to permission issues.")
+        print("Possible Solutions:")
+        print("1. Close the file if it's open in Excel or another program.")
+        print("2. Check file permissions and ensure you have access.")
+        print("3. Try running the script as Administrator.")
+        print(f"Technical Details: {e}")
+        sys.exit(1)
+
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        sys.exit(1)
+    
+    print("--------------------------------------------------------------------------------------")
+    print(f"Submitted applications added to the list")
+        
+def viewed_applications(store, records, verbose=0, rewrite=False):
+
+    print(f"\nMatching viewed applications")
+    
+    # Rows a rebuild has already set from an earlier notice in this replay
+    replayed = set()
+    try:
+        for record in records:
+            if verbose:
+                print("--------------------------------------------------------------------------------------")     
+                print(f"UID: {record.uid} | Subject: {record.subject}")
+            
+            email_date = record.email_date
+            matching_row = store.find_row(record.company, record.position, record.application_date)
+                    
+            if matching_row:
+                store.set_viewed(matching_row, email_date, overwrite=rewrite and matching_row not in replayed)
+                replayed.add(matching_row)
+            metrics.count("viewed_matched" if matching_row else "viewed_unmatched")
+                
+            if verbose:
+                print(f"Date: {email_date}")
+                print(f"Position: {record.position}")
+                print(f"Company: {record.company}")
+                print(f"Application date: {record.application_date}")
+            
+    except PermissionError as e:
+        print(f"Error: Unable to access '{store.path}' due to permission issues.")
+        print("Possible Solutions:")
+        print("1. Close the file if it's open in Excel or another program.")
+        print("2. Check file permissions and ensure you have access.")
+        print("3. Try running the script as Administrator.")
+        print(f"Technical Details: {e}")
+        sys.exit(1)
+        
+    except Exception as e:
+        raise Exception(f"Unable to update the application store '{store.path}': {e}") from e
+        
+    print("--------------------------------------------------------------------------------------")
+    print(f"Viewed applications updated")
+        
+def closed_applications(store, records, verbose=0, rewrite=False):
+
+    print(f"\nMatching closed applications")
+    
+    # Rows a rebuild has already set from an earlier notice in this replay
+    replayed = set()
+    try:
+        for record in records:
+            if verbose:
+                print("--------------------------------------------------------------------------------------")     
+                print(f"UID: {record.uid} | Subject: {record.subject}")
+            
+            email_date = record.email_date
+            applicant_count = record.applicant_count
+            if verbose and applicant_count is not None:
+                print(f"Applicant count: {applicant_count}")
+            
+            # Consider possibility of companies changing their name
+            matching_row = store.find_row(record.company, record.position, record.application_date, fallback=True)
+                    
+            if matching_row:
+                store.set_closed(matching_row, email_date, applicant_count, overwrite=rewrite and matching_row not in replayed)
+                replayed.add(matching_row)
+            metrics.count("closed_matched" if matching_row else "closed_unmatched")
+                
+            if verbose:
+                print(f"Date: {email_date}")
+                print(f"Position: {record.position}")
+                print(f"Company: {record.company}")
+                print(f"Application date: {record.application_date}")
+        
+    except PermissionError as e:
+        print(f"Error: Unable to access '{store.path}' due to permission issues.")
+        print("Possible Solutions:")
+        print("1. Close the file if it's open in Excel or another program.")
+        print("2. Check file permissions and ensure you have access.")
+        print("3. Try running the script as Administrator.")
+        print(f"Technical Details: {e}")
+        sys.exit(1)
+        
+    except Exception as e:
+        raise Exception(f"Unable to update the application store '{store.path}': {e}") from e
+        
+    print("--------------------------------------------------------------------------------------")
+    print(f"Closed applications updated")
+
+PASSES = {
+    "submitted": submitted_applications,
+    "viewed": viewed_applications,
+    "closed": closed_applications,
+}